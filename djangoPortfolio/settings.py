@@ -39,6 +39,8 @@ SECRET_KEY = os.environ.get("DJANGO_SECRET_KEY", "fallback-dev-key")
 
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
+# Raise when a view decorated with query_budget runs more queries than it declares.
+ENFORCE_QUERY_BUDGETS = os.environ.get("ENFORCE_QUERY_BUDGETS") == "True"
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 
 ALLOWED_HOSTS = ["stockbot10000-5e60e73638a9.herokuapp.com", "localhost", "127.0.0.1", "web-production-6a556.up.railway.app"]
@@ -130,6 +132,20 @@ else:
         "default": dj_database_url.config(default=os.environ.get("DATABASE_URL"), conn_max_age=600, ssl_require=True)
     }
 
+CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL", "redis://localhost:6379/0")
+
+# Session read endpoints are cached per session version (portfolioapp/session_cache.py), and the
+# Celery tasks keep their conversation slots and tick markers in the same cache, so every web and
+# worker process must share it: Redis, the broker's unless REDIS_URL says otherwise. LOCAL included,
+# since the worker needs the broker's Redis running anyway.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ.get("REDIS_URL", CELERY_BROKER_URL),
+    }
+}
+SESSION_CACHE_TIMEOUT = 60 * 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -189,5 +205,3 @@ CELERY_BEAT_SCHEDULE = {
         "schedule": 60 * 15,
     },
 }
-
-CELERY_BROKER_URL = "redis://localhost:6379/0"
\ No newline at end of file
@@ -7,7 +7,7 @@ class SessionForm(forms.ModelForm):
 
     class Meta:
         model = SimulationSession
-        fields = ["name", "amount", "use_twitter", "use_google", "use_price_history", "simulated_date"]
+        fields = ["name", "amount", "use_twitter", "use_google", "use_price_history", "simulated_date", "strategy"]
 
     def clean_stocks(self):
         data = self.cleaned_data["stocks"]
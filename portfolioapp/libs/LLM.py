@@ -3,7 +3,7 @@ import os
 import time
 import logging
 from dotenv import load_dotenv
-from typing import Dict, Union
+from typing import Dict, List, Union
 from django.db.models import Sum
 from autogen_core.tools import FunctionTool
 from autogen_core.models import ModelFamily
@@ -15,8 +15,10 @@ from autogen_ext.models.openai import OpenAIChatCompletionClient
 from datetime import timedelta
 
 from portfolioapp.models import Portfolio, SimulationSession
-from portfolioapp.libs.data_fetchers import google_news_fetcher, twitter_news_fetcher, stock_data_wrapper
+from portfolioapp.libs.data_fetchers import google_news_fetcher, twitter_news_fetcher, stock_data_wrapper, fetch_concurrently, feed_cache
 from portfolioapp.libs.tickers import available_tickers
+from portfolioapp.libs.features import price_feature_pack
+from portfolioapp.libs.strategies import MarketData, PortfolioView, price_history, strategies
 
 load_dotenv()
 
@@ -104,17 +106,29 @@ class LLMSession:
             return f"Sell failed: {str(e)}"
 
 
-    def get_portfolio(self) -> Dict[str, float]:
+    def trade(self, orders: List[Dict[str, Union[str, float]]]) -> List[Dict[str, Union[str, float, None]]]:
+        portfolio = self.portfolio
+        if not portfolio:
+            return [{"error": "No active portfolio found."}]
+        if not isinstance(orders, list):
+            logging.error(f"Trade failed: orders must be a list, got {type(orders).__name__}.")
+            return [{"error": "Orders must be a list of orders."}]
+        try:
+            results = portfolio.execute_orders(orders)
+            logging.debug(f"Trade results: {results}")
+            return results
+        except Exception as e:
+            logging.error(f"Trade failed: {e}")
+            return [{"error": f"Trade failed: {str(e)}"}]
+
+
+    def get_portfolio(self) -> Dict[str, Union[str, float, list]]:
         portfolio = self.portfolio
         if not portfolio:
             return {"error": "No active portfolio found."}
-        holdings = portfolio.holdings.all()
-        logging.debug(f"Current portfolio holdings: {holdings}")
-        return [{"ticker": h.ticker, 
-                 "shares": h.shares,
-                 "purchase_price": h.share_price_at_purchase,
-                 "current_share_price" : stock_data_wrapper.get(h.ticker, self.session.simulated_date)} 
-                                                                for h in holdings]
+        valuation = portfolio.get_valuation()
+        logging.debug(f"Current portfolio holdings: {valuation.positions}")
+        return valuation.as_dict()
 
 
     def get_data(self) -> Dict[str, Union[str, float]]:
@@ -123,27 +137,28 @@ class LLMSession:
 
             date = self.session.simulated_date
 
+            # All news feeds for the day are fetched in parallel.
+            jobs = {}
             if self.session.use_twitter:
-                data["twitter"] = twitter_news_fetcher.fetch("STOCK MARKET NEWS",
-                                                             date = date)
+                jobs["twitter"] = (twitter_news_fetcher, "STOCK MARKET NEWS", {"date": date})
                 for ticker in available_tickers:
-                    data[f"{ticker}_twitter"] = google_news_fetcher.fetch(ticker, 
-                                                                                date=date,
-                                                                                count=2)
-
+                    jobs[f"{ticker}_twitter"] = (google_news_fetcher, ticker, {"date": date, "count": 2})
 
             if self.session.use_google:
-                data["google"] = google_news_fetcher.fetch("STOCK MARKET NEWS",
-                                                           date=date)
+                jobs["google"] = (google_news_fetcher, "STOCK MARKET NEWS", {"date": date})
                 for ticker in available_tickers:
-                    data[f"{ticker}_google"] = google_news_fetcher.fetch(ticker, 
-                                                                                     date=date,
-                                                                                     count=2)
+                    jobs[f"{ticker}_google"] = (google_news_fetcher, ticker, {"date": date, "count": 2})
+
+            results, errors = fetch_concurrently(jobs)
+            data.update(results)
+            if errors:
+                # Say which feeds are missing, so the agents don't read their absence as no news.
+                data["unavailable"] = sorted(errors)
+            logging.info(f"Feed cache: {feed_cache.stats()}")
 
             if self.session.use_price_history:
-                for ticker in available_tickers:
-                    data[f"{ticker}_yesterday"] = stock_data_wrapper.get(ticker, date - timedelta(days=1))
-                    data[ticker] = google_news_fetcher.fetch_market_data(ticker, date=date)
+                # One row per ticker: close, previous close, returns, moving averages, volatility, 52-week range.
+                data["price_features"] = price_feature_pack(available_tickers, date).to_csv()
 
             return data or {"message": "No data sources enabled for this session. You are to proceed without data."}
 
@@ -166,6 +181,12 @@ class LLMSession:
         tools = [
             FunctionTool(self.buy, name="buy", description="Buy a stock."),
             FunctionTool(self.sell, name="sell", description="Sell a stock."),
+            FunctionTool(
+                self.trade,
+                name="trade",
+                description="Buy and sell several stocks at once. Each order is a dict with action (buy or sell), "
+                            "ticker, shares and reasoning. Orders run in sequence; returns the outcome of each.",
+            ),
         ]
         interfacing_agent = self.create_agent(
             name="interfacing_agent",
@@ -173,7 +194,7 @@ class LLMSession:
             system_message=(
                 "You are an autonomous trading agent managing a simulated portfolio. "
                 "You may use all available cash to buy stocks. "
-                "Use the tools available (buy, sell). "
+                "Use the tools available (buy, sell, trade). Prefer trade when placing several orders. "
                 "Make decisions using Twitter, Google Trends, and Price History data, if enabled."
             ),
             tools=tools,
@@ -205,6 +226,25 @@ class LLMSession:
    
 
 
+def trade_with_strategy(session):
+    """One day of a rule-based session: the strategy decides from the day's prices and the orders go through execute_orders."""
+    strategy = strategies[session.strategy]()
+    symbols = set(session.stocks.values_list("symbol", flat=True))
+    tickers = [t for t in available_tickers if t in symbols] or list(available_tickers)
+    day = session.simulated_date.date()
+    _, closes = price_history(tickers, day, day, strategy.lookback)
+    if not closes.shape[1]:
+        return []
+
+    portfolio = session.portfolio
+    valuation = portfolio.get_valuation()
+    view = PortfolioView(valuation.cash, {p.ticker: p.shares for p in valuation.positions})
+    orders = strategy.decide(day, view, MarketData(tickers, closes[:, -strategy.lookback:]))
+    results = portfolio.execute_orders(orders) if orders else []
+    logging.debug(f"{strategy.name} trade results: {results}")
+    return results
+
+
 def start_trade_for_session(session_id, stage="Start"):
     logging.info(f"Starting trade session for ID: {session_id}")
     session = SimulationSession.objects.get(id=session_id)
@@ -214,8 +254,13 @@ def start_trade_for_session(session_id, stage="Start"):
         session.portfolio = portfolio
         session.save()
 
-    llm_session = LLMSession(session_id)
+    if session.strategy:
+        trade_with_strategy(session)
+        return
 
+    llm_session = LLMSession(session_id)
+    # One batched download covers the portfolio, the price history data and every trade below.
+    stock_data_wrapper.prefetch(available_tickers, session.simulated_date - timedelta(days=1), session.simulated_date)
 
     task = prompts[stage]
     current_portfolio = str(llm_session.get_portfolio())
@@ -1,95 +1,302 @@
 import json
+import logging
 import os
 import time
 import feedparser
+import requests
 import yfinance as yf
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from portfolioapp.libs.tickers import available_tickers
-from fuzzywuzzy import process
-from datetime import datetime, timedelta
+from portfolioapp.libs.price_store import PriceStore
+from portfolioapp.libs.price_matrix import PriceMatrix, day_number, day_string
+from portfolioapp.libs.feed_cache import FeedCache
+from portfolioapp.libs.replay import snapshot_archive
+from portfolioapp.libs.topic_resolver import TopicResolver, topic_aliases
+from datetime import date, datetime, timedelta
 import random
 from dotenv import load_dotenv
+import numpy as np
 import pandas as pd
 
 load_dotenv()
-use_logged_data = False
+# Serve news and prices from log_data snapshots instead of the network, e.g. for offline backtests.
+use_logged_data = os.getenv("USE_LOGGED_DATA") == "True"
+logged_data_folder = os.getenv("LOGGED_DATA_FOLDER", "daily_data")
 topics = ["STOCK MARKET NEWS", "POLITICS NEWS", "ECONOMICS NEWS", "TECH NEWS", "BUSINESS NEWS"] + available_tickers
+topic_resolver = TopicResolver(topics, available_tickers, aliases=topic_aliases)
 
 class StockDataWrapper:
-    def __init__(self):
-        self.cache = {}
+    # A cache miss downloads this many days on either side of the requested date,
+    # so neighbouring lookups (yesterday, the next market day) are served locally.
+    miss_window = timedelta(days=7)
+    # Today's close isn't final, so an intraday price is served for this many seconds before it's fetched again.
+    live_ttl = 15 * 60
+
+    def __init__(self, store=None, replay=None):
+        """
+        store is an optional PriceStore shared with other processes.
+        replay is an optional SnapshotArchive to read prices from instead of yfinance.
+
+        """
+        self.prices = PriceMatrix()
+        # ticker -> list of (start, end) day numbers already downloaded, end exclusive.
+        # Days inside a fetched range without a price are non-trading days.
+        self.fetched = {}
+        self.store = store
+        self.replay = replay
+        self._loaded = set()
+        # (ticker, day number) -> monotonic time its intraday price stops being served.
+        self._live = {}
+
+    def _load(self, tickers, reload=False):
+        """Pull tickers from the on-disk store, which other processes may have filled since we last looked."""
+        if self.store is None:
+            return
+        tickers = [t for t in tickers if reload or t not in self._loaded]
+        if not tickers:
+            return
+        prices, ranges = self.store.load(tickers)
+        self.prices.update({t: {day_number(d): close for d, close in days.items()} for t, days in prices.items()})
+        for ticker in tickers:
+            known = {(day_number(s), day_number(e)) for s, e in ranges[ticker]}
+            self.fetched[ticker] = list(known.union(self.fetched.get(ticker, [])))
+            self._loaded.add(ticker)
+
+    def _expire_live(self):
+        """Blank out intraday prices past their TTL, so the next lookup downloads them again."""
+        if not self._live:
+            return
+        now = time.monotonic()
+        stale = {}
+        for (ticker, day), expires in list(self._live.items()):
+            if expires <= now:
+                self._live.pop((ticker, day), None)
+                stale.setdefault(ticker, {})[day] = np.nan
+        if stale:
+            self.prices.update(stale)
+
+    def _is_fetched(self, ticker, start, end):
+        return any(s <= start and end <= e for s, e in self.fetched.get(ticker, []))
+
+    def prefetch(self, tickers, start, end):
+        """
+        Download closing prices for every ticker from start to end (inclusive) in a single
+        batched request and fill the cache. Tickers whose range was already fetched are skipped.
+
+        """
+        start, end = day_number(start), day_number(end) + 1
+        tickers = list(dict.fromkeys(tickers))
+        self._load(tickers)
+        missing = [t for t in tickers if not self._is_fetched(t, start, end)]
+        if missing:
+            self._load(missing, reload=True)
+            missing = [t for t in missing if not self._is_fetched(t, start, end)]
+        if not missing:
+            return
+
+        # Today's close isn't final yet, so only days before today are marked fetched and persisted.
+        fetched_end = min(end, date.today().toordinal())
+        if self.replay is not None:
+            prices = self.replay.prices(missing, start, end)
+        else:
+            prices = self.download(missing, start, end)
+        self.prices.update(prices)
+        expires = time.monotonic() + self.live_ttl
+        self._live.update({(t, d): expires for t, days in prices.items() for d in days if d >= fetched_end})
+
+        # A ticker that came back without a single close failed to download (yfinance reports that as
+        # empty rows, not an error), so its range stays unfetched and the next lookup asks again.
+        ranges = []
+        if start < fetched_end:
+            for ticker in (t for t in missing if prices.get(t)):
+                self.fetched.setdefault(ticker, []).append((start, fetched_end))
+                ranges.append((ticker, day_string(start), day_string(fetched_end)))
+        if self.store is not None:
+            closed = {t: {day_string(d): close for d, close in days.items() if d < fetched_end} for t, days in prices.items()}
+            self.store.save(closed, ranges)
+
+    def _fetch_around(self, tickers, day):
+        """Handle a cache miss on day: skip tickers already known to have no price then, fetch a window for the rest."""
+        self._load(tickers)
+        tickers = [t for t in tickers if not self._is_fetched(t, day, day + 1)]
+        if tickers:
+            self.prefetch(tickers, day - self.miss_window.days, day + self.miss_window.days)
+
+    @staticmethod
+    def download(tickers, start, end):
+        """
+        {ticker: {day number: close}} straight from yfinance for start to end day numbers, end exclusive.
+        Closes are raw, as traded that day, so they match share_price_at_purchase and never change.
+
+        """
+        df = yf.download(tickers, start=day_string(start), end=day_string(end), progress=False, auto_adjust=False)
+        prices = {}
+        if not df.empty:
+            closes = df["Close"]
+            if isinstance(closes, pd.Series):
+                closes = closes.to_frame(tickers[0])
+            for ticker in closes.columns:
+                prices[ticker] = {day_number(day): round(float(value), 2) for day, value in closes[ticker].dropna().items()}
+        return prices
 
     def get(self, ticker, date):
-        normalized_date = pd.to_datetime(date)
-        date_str = normalized_date.strftime("%Y-%m-%d")
-        next_day_str = (normalized_date + timedelta(days=1)).strftime("%Y-%m-%d")
+        self._expire_live()
+        day = day_number(date)
+        value = self.prices.get(ticker, day)
+        if value != value:
+            self._fetch_around([ticker], day)
+            value = self.prices.get(ticker, day)
+            if value != value:
+                raise ValueError(f"No data available for {ticker} on {day_string(day)}")
+        return float(value)
 
-        if ticker in self.cache and date_str in self.cache[ticker]:
-            return self.cache[ticker][date_str]
-        
-        
-        df = yf.download(ticker, start=date_str, end=next_day_str, progress=False)
+    def get_many(self, tickers, date):
+        """Closing prices of tickers on one date as a NumPy array, fetching any that aren't cached."""
+        self._expire_live()
+        day = day_number(date)
+        values = self.prices.get_many(tickers, day)
+        missing = np.isnan(values)
+        if missing.any():
+            self._fetch_around(list({t for t, m in zip(tickers, missing) if m}), day)
+            values = self.prices.get_many(tickers, day)
+            missing = np.isnan(values)
+            if missing.any():
+                absent = ", ".join(sorted({t for t, m in zip(tickers, missing) if m}))
+                raise ValueError(f"No data available for {absent} on {day_string(day)}")
+        return values
 
-        if df.empty:
-            print(df)
-            raise ValueError(f"No data available for {ticker} on {date_str}")
-        value = round(float(df['Close'].iloc[0].item()), 2)
-        if ticker not in self.cache:
-            self.cache[ticker] = {}
-        self.cache[ticker][date_str] = value
+    def get_matrix(self, tickers, dates):
+        """
+        Closing prices as a len(tickers) x len(dates) NumPy array, fetched in one request if needed.
+        Non-trading days come back as NaN instead of raising.
+
+        """
+        self._expire_live()
+        days = [day_number(d) for d in dates]
+        if days:
+            self.prefetch(tickers, min(days), max(days))
+        return self.prices.get_matrix(tickers, days)
 
-        return value
 
 
+if use_logged_data:
+    stock_data_wrapper = StockDataWrapper(replay=snapshot_archive(logged_data_folder))
+else:
+    stock_data_wrapper = StockDataWrapper(store=PriceStore(os.getenv("PRICE_STORE_PATH", "price_store.sqlite3")))
 
-stock_data_wrapper = StockDataWrapper()
 
+# Feeds are fetched through one pooled HTTP session; this caps how many run at once.
+max_concurrent_fetches = int(os.getenv("MAX_CONCURRENT_FETCHES", 16))
+http_session = requests.Session()
+http_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=max_concurrent_fetches))
+http_session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=max_concurrent_fetches))
+
+# Shared by the news singletons. Set FEED_CACHE_PATH to also keep closed windows on disk.
+feed_cache = FeedCache(ttl=int(os.getenv("FEED_CACHE_TTL", 600)), path=os.getenv("FEED_CACHE_PATH"))
 
 google_url = "https://news.google.com/rss/search?q={topic}&hl=en-US&gl=US&ceid=US:en"
 twitter_url = "https://news.google.com/rss/search?q=%24{topic}+site:twitter.com&hl=en-US&gl=US&ceid=US:en"
 
 
 class DataFetcher:
-    def __init__(self, type, url=None, folder=None, info=""):
+    def __init__(self, type, url=None, folder=None, info="", timeout=10, cache=None, source="google"):
         """
         For url, include {topic} in the URL where the topic should be inserted.
+        For replay, folder is where log_data saved its snapshots and source picks "google" or "twitter".
+        timeout is in seconds and applies to each feed request.
+        cache is an optional FeedCache for results.
 
         """
         self.type = type
         if type == "url":
             assert url is not None, "URL must be provided for type 'url'"
             self.url = url
+        if type == "replay":
+            assert folder is not None, "Folder must be provided for type 'replay'"
+            self.archive = snapshot_archive(folder)
+            self.source = source
       
         self.info = info
+        self.timeout = timeout
+        self.cache = cache
+        # url -> (ETag, Last-Modified, result) of the last conditional fetch.
+        self._validators = {}
+
+    def fetch(self, query, date: datetime = None, count=5, at=None):
+        """at is an "HH-MM" capture time, only used when replaying; it defaults to the day's last capture."""
+        query = topic_resolver.resolve(query)
 
-    def fetch(self, query, date: datetime = None, count=5):
-        query = query.upper()
-        if query not in topics:
-            if "MARKET_DATA" in query:
-                ticker_part = query.replace("MARKET_DATA_", "")
-                if ticker_part not in available_tickers:
-                    raise ValueError(f"Invalid ticker: {ticker_part}")
-            elif query in available_tickers:
-                query = f"STOCK MARKET {query}"
-            else:
-                match = process.extractOne(query, topics)
-                if match[1] < 70:
-                    raise ValueError(f"No matching topic found for '{query}'")
-                query = match[0]
-
-        query = query.replace(" ", "+")
+        if self.type == "replay":
+            return self._replay(query, date, at)
 
+        # A window that ended before today is closed, so its headlines are final.
+        closed = False
         if date:
             start_str = date.strftime("%Y-%m-%d")
             end_str = (date + timedelta(days=1)).strftime("%Y-%m-%d")
             query += f"+after:{start_str}+before:{end_str}"
+            closed = end_str <= datetime.now().strftime("%Y-%m-%d")
+
+        if self.cache is not None:
+            key = (self.type, getattr(self, "url", None), query, count)
+            hit, result = self.cache.get(key)
+            if hit:
+                return result
 
         if self.type == "url":
             formatted_url = self.url.format(topic=query)
-            data = feedparser.parse(formatted_url).entries
-            result = [entry.title for entry in data]
-            result = result[:count]
-            return ' '.join(result)
+            response = http_session.get(formatted_url, timeout=self.timeout)
+            response.raise_for_status()
+            result = self._titles(response.content, count)
+            if self.cache is not None:
+                self.cache.set(key, result, permanent=closed)
+            return result
+
+    @staticmethod
+    def _titles(content, count):
+        data = feedparser.parse(content).entries
+        result = [entry.title for entry in data]
+        result = result[:count]
+        return ' '.join(result)
 
+    def fetch_if_changed(self, query, count=5):
+        """
+        Fetch the current feed for query with a conditional request, sending the ETag and
+        Last-Modified seen last time. Returns (changed, result); a 304 or an identical
+        result counts as unchanged.
+
+        """
+        formatted_url = self.url.format(topic=topic_resolver.resolve(query))
+        etag, modified, previous = self._validators.get(formatted_url, (None, None, None))
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if modified:
+            headers["If-Modified-Since"] = modified
+        response = http_session.get(formatted_url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304:
+            return False, previous
+        response.raise_for_status()
+        result = self._titles(response.content, count)
+        self._validators[formatted_url] = (response.headers.get("ETag"), response.headers.get("Last-Modified"), result)
+        return result != previous, result
+
+
+    def _replay(self, query, date, at):
+        # log_data captured tickers under "STOCK MARKET <ticker>" and stored the joined titles per source.
+        topic = query.replace("+", " ")
+        if topic in available_tickers:
+            topic = f"STOCK MARKET {topic}"
+        entry = self.archive.lookup(topic, date, at)
+        # A shard only holds the sources that were captured, so one of them can be missing on its own.
+        if entry is None or entry.get(self.source) is None:
+            raise ValueError(f"No logged {self.source} data for '{topic}' on {date}")
+        return entry[self.source]
+
+    def fetch_many(self, queries, date: datetime = None, count=5):
+        """Fetch several queries in parallel, returning ({query: result}, {query: exception})."""
+        return fetch_concurrently({query: (self, query, {"date": date, "count": count}) for query in queries})
 
     def fetch_market_data(self, ticker, date):
         return {
@@ -97,7 +304,36 @@ class DataFetcher:
         }
 
 
-# Singleton instance for Google News
-google_news_fetcher = DataFetcher(type="url", url=google_url)
-# Singleton instance for Twitter News
-twitter_news_fetcher = DataFetcher(type="url", url=twitter_url)
\ No newline at end of file
+def fetch_concurrently(jobs, max_workers=None, method="fetch"):
+    """
+    Run {key: (fetcher, query, kwargs)} jobs on a thread pool, calling fetcher.<method>(query, **kwargs)
+    for each, and return ({key: result}, {key: exception}). Wall time is bounded by the slowest feed
+    rather than the sum of all of them, and one bad feed doesn't sink the rest.
+
+    """
+    if not jobs:
+        return {}, {}
+    workers = min(max_workers or max_concurrent_fetches, len(jobs))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            key: executor.submit(getattr(fetcher, method), query, **kwargs)
+            for key, (fetcher, query, kwargs) in jobs.items()
+        }
+    results, errors = {}, {}
+    for key, future in futures.items():
+        try:
+            results[key] = future.result()
+        except Exception as e:
+            logging.error(f"Fetch failed for {key}: {e}")
+            errors[key] = e
+    return results, errors
+
+
+if use_logged_data:
+    google_news_fetcher = DataFetcher(type="replay", folder=logged_data_folder, source="google")
+    twitter_news_fetcher = DataFetcher(type="replay", folder=logged_data_folder, source="twitter")
+else:
+    # Singleton instance for Google News
+    google_news_fetcher = DataFetcher(type="url", url=google_url, cache=feed_cache)
+    # Singleton instance for Twitter News
+    twitter_news_fetcher = DataFetcher(type="url", url=twitter_url, cache=feed_cache)
\ No newline at end of file
@@ -0,0 +1,32 @@
+import numpy as np
+
+
+def lttb(x, y, threshold):
+    """
+    Indices of the points Largest-Triangle-Three-Buckets keeps to draw the series (x, y) with
+    `threshold` points. The first and last points are always kept. The points between them are
+    split into threshold - 2 buckets, and each bucket keeps the point making the largest triangle
+    with the point kept before it and the average of the next bucket. Below 3 points there are
+    no buckets, so only the first and last points are kept.
+
+    """
+    n = len(x)
+    if threshold >= n:
+        return np.arange(n)
+    if threshold < 3:
+        return np.array([0, n - 1], dtype=np.intp)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # threshold - 1 edges bound the threshold - 2 buckets over the inner points 1 .. n - 2.
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.intp)
+    kept = np.empty(threshold, dtype=np.intp)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        following = slice(end, edges[i + 2]) if i + 2 < len(edges) else slice(n - 1, n)
+        next_x, next_y = x[following].mean(), y[following].mean()
+        area = np.abs((x[a] - next_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y - y[a]))
+        a = start + int(area.argmax())
+        kept[i + 1] = a
+    return kept
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+
+from portfolioapp.libs.data_fetchers import stock_data_wrapper
+from portfolioapp.libs.price_matrix import day_number
+from portfolioapp.libs.trading_calendar import trading_calendar
+
+TRADING_DAYS_PER_YEAR = 252
+
+
+def price_window(tickers, date, window=TRADING_DAYS_PER_YEAR):
+    """
+    Closing prices for the last `window` trading days up to and including date, as a
+    days x tickers DataFrame, forward filled over gaps. Everything comes from one prefetch.
+
+    """
+    end = day_number(date)
+    # Calendar days that cover `window` trading days, holidays included.
+    start = end - int(window * 1.45) - 10
+    stock_data_wrapper.prefetch(list(tickers) + [trading_calendar.reference_ticker], start, end)
+    days = trading_calendar.trading_days_between(start, end)[-window:]
+    closes = stock_data_wrapper.get_matrix(tickers, days)
+    return pd.DataFrame(closes.T, index=pd.DatetimeIndex(days), columns=list(tickers)).ffill()
+
+
+def price_feature_pack(tickers, date, window=TRADING_DAYS_PER_YEAR):
+    """
+    One row per ticker of price features as of date: close, previous close, trailing returns,
+    moving averages, annualized volatility and 52-week range. Computed column-wise over the
+    whole price window at once.
+
+    """
+    closes = price_window(tickers, date, window)
+    returns = closes.pct_change(fill_method=None)
+    last = closes.iloc[-1]
+
+    def trailing_return(days):
+        return last / closes.iloc[-1 - days] - 1 if len(closes) > days else pd.Series(np.nan, index=closes.columns)
+
+    high, low = closes.max(), closes.min()
+    pack = pd.DataFrame({
+        "close": last,
+        "prev_close": closes.iloc[-2] if len(closes) > 1 else np.nan,
+        "ret_1d": trailing_return(1),
+        "ret_5d": trailing_return(5),
+        "ret_21d": trailing_return(21),
+        "ret_63d": trailing_return(63),
+        "sma_20": closes.tail(20).mean(),
+        "sma_50": closes.tail(50).mean(),
+        "vol_21d": returns.tail(21).std() * np.sqrt(TRADING_DAYS_PER_YEAR),
+        "high_52w": high,
+        "low_52w": low,
+        "off_high": last / high - 1,
+    })
+    pack.index.name = "ticker"
+    price_columns = ["close", "prev_close", "sma_20", "sma_50", "high_52w", "low_52w"]
+    return pack.round({**{c: 2 for c in price_columns}, **{c: 4 for c in pack.columns if c not in price_columns}})
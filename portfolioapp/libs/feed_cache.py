@@ -0,0 +1,79 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class FeedCache:
+    """
+    Bounded LRU cache of feed results. Results for a closed historical window never change,
+    so they never expire and are also written to an optional SQLite file shared across
+    processes. Results for today's window or with no date expire after ttl seconds.
+
+    """
+
+    def __init__(self, maxsize=4096, ttl=600, path=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = path
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        if getattr(self._local, "pid", None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS feeds (key TEXT PRIMARY KEY, value TEXT NOT NULL) WITHOUT ROWID")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    def get(self, key):
+        """Returns (True, value) on a hit and (False, None) on a miss."""
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > time.monotonic()):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[1]
+        if self.path:
+            row = self.connection.execute("SELECT value FROM feeds WHERE key = ?", (json.dumps(key),)).fetchone()
+            if row:
+                value = json.loads(row[0])
+                self._remember(key, value, None)
+                with self._lock:
+                    self.hits += 1
+                return True, value
+        with self._lock:
+            self.misses += 1
+        return False, None
+
+    def set(self, key, value, permanent):
+        self._remember(key, value, None if permanent else time.monotonic() + self.ttl)
+        if permanent and self.path:
+            with self.connection:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO feeds (key, value) VALUES (?, ?)", (json.dumps(key), json.dumps(value))
+                )
+
+    def _remember(self, key, value, expires_at):
+        with self._lock:
+            self.entries[key] = (expires_at, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "size": len(self.entries),
+        }
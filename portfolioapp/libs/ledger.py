@@ -0,0 +1,107 @@
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Optional
+
+
+def consume_fifo(lots, shares, price):
+    """
+    Sell `shares` out of `lots`, a list of (id, shares, purchase price) tuples oldest first.
+    Returns (ids of lots fully consumed, (id, shares left) for a partly consumed lot or None,
+    realized profit). Shared by every path that sells, so FIFO accounting lives in one place.
+
+    """
+    remaining = shares
+    consumed = []
+    partial = None
+    profit = 0
+    for lot_id, lot_shares, purchase_price in lots:
+        if remaining <= 0:
+            break
+        if lot_shares <= remaining:
+            remaining -= lot_shares
+            profit += (price - purchase_price) * lot_shares
+            consumed.append(lot_id)
+        else:
+            profit += (price - purchase_price) * remaining
+            partial = (lot_id, lot_shares - remaining)
+            remaining = 0
+    return consumed, partial, profit
+
+
+@dataclass(eq=False)
+class Lot:
+    """Shares of one ticker bought at one price. id is None until the lot is saved as a Position."""
+
+    id: Optional[int]
+    ticker: str
+    shares: float
+    price: float
+
+
+class Book:
+    """
+    Cash and open lots held in memory, trading with the same FIFO accounting as the database.
+    Records what changed so a caller can persist a whole batch of trades at once: lots opened
+    (and still open), ids of saved lots sold off, and saved lots left with fewer shares.
+
+    """
+
+    def __init__(self, cash, lots=()):
+        self.cash = cash
+        self.lots = defaultdict(list)
+        for lot in lots:
+            self.lots[lot.ticker].append(lot)
+        self.opened = []
+        self.closed = []
+        self.changed = {}
+
+    def shares(self, ticker):
+        return sum(lot.shares for lot in self.lots.get(ticker, ()))
+
+    def positions(self):
+        """Shares held per ticker."""
+        return {ticker: total for ticker, lots in self.lots.items() if (total := sum(lot.shares for lot in lots)) > 0}
+
+    def fill(self, action, ticker, shares, price):
+        """Apply one buy or sell and return its realized profit, 0 for a buy."""
+        if shares <= 0:
+            raise ValueError("Shares must be greater than 0")
+        if action == "buy":
+            self.buy(ticker, shares, price)
+            return 0
+        return self.sell(ticker, shares, price)
+
+    def buy(self, ticker, shares, price):
+        cost = shares * price
+        if cost > self.cash:
+            raise ValueError(f"Insufficient funds, available: {self.cash} share price: {price}, shares: {shares} "
+                             f"total cost: {cost}")
+        self.cash -= cost
+        lot = Lot(None, ticker, shares, price)
+        self.lots[ticker].append(lot)
+        self.opened.append(lot)
+        return cost
+
+    def sell(self, ticker, shares, price):
+        """Sell oldest lots first and return the realized profit."""
+        lots = self.lots.get(ticker, [])
+        if shares > sum(lot.shares for lot in lots):
+            raise ValueError("Not enough shares")
+        consumed, partial, profit = consume_fifo(
+            [(i, lot.shares, lot.price) for i, lot in enumerate(lots)], shares, price
+        )
+        for i in consumed:
+            lot = lots[i]
+            if lot.id is None:
+                self.opened.remove(lot)
+            else:
+                self.closed.append(lot.id)
+                self.changed.pop(lot.id, None)
+        if partial:
+            lot = lots[partial[0]]
+            lot.shares = partial[1]
+            if lot.id is not None:
+                self.changed[lot.id] = lot.shares
+        lots[:len(consumed)] = []
+        self.cash += shares * price
+        return profit
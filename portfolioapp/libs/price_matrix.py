@@ -0,0 +1,89 @@
+import threading
+from datetime import date, datetime
+
+import numpy as np
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def day_number(value):
+    """
+    Ordinal day number of a date, datetime, pandas Timestamp or "YYYY-MM-DD" string.
+    This is the integer key every price lookup uses, and is much cheaper than pd.to_datetime.
+
+    """
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10]).toordinal()
+    if isinstance(value, (date, datetime)):
+        return value.toordinal()
+    if isinstance(value, np.datetime64):
+        return int(value.astype("datetime64[D]").astype(np.int64)) + EPOCH_ORDINAL
+    return int(value)
+
+
+def day_string(number):
+    return date.fromordinal(number).isoformat()
+
+
+class PriceMatrix:
+    """
+    Dense tickers x days array of closing prices, NaN where there is no price.
+    Tickers and days map to rows and columns through plain dicts, so a lookup is two dict hits
+    and an array index. Every update fills a fresh copy and swaps in a new (ticker_index, day_index,
+    values) tuple in one assignment, so readers in other threads always see a consistent snapshot.
+
+    """
+
+    def __init__(self):
+        self.tickers = []
+        self.days = np.empty(0, dtype=np.int64)
+        self._state = ({}, {}, np.empty((0, 0)))
+        self._lock = threading.Lock()
+
+    def update(self, prices):
+        """Insert {ticker: {day_number: close}} prices, adding rows and columns as needed."""
+        with self._lock:
+            ticker_index, day_index, values = self._state
+            new_tickers = [t for t in prices if t not in ticker_index]
+            new_days = {d for days in prices.values() for d in days}.difference(day_index)
+            if new_tickers or new_days:
+                tickers, days, values = self._grow(new_tickers, new_days)
+                ticker_index = {t: i for i, t in enumerate(tickers)}
+                day_index = {int(d): i for i, d in enumerate(days)}
+            else:
+                # Readers may hold the current array, so it's never written to in place.
+                tickers, days, values = self.tickers, self.days, values.copy()
+            for ticker, closes in prices.items():
+                if closes:
+                    values[ticker_index[ticker], [day_index[d] for d in closes]] = list(closes.values())
+            self.tickers, self.days = tickers, days
+            self._state = (ticker_index, day_index, values)
+
+    def _grow(self, new_tickers, new_days):
+        """A copy of the current values with rows and columns added, as (tickers, days, values)."""
+        _, _, old_values = self._state
+        days = np.union1d(self.days, np.fromiter(new_days, dtype=np.int64, count=len(new_days)))
+        values = np.full((len(self.tickers) + len(new_tickers), len(days)), np.nan)
+        values[: len(self.tickers), np.searchsorted(days, self.days)] = old_values
+        return self.tickers + new_tickers, days, values
+
+    def get(self, ticker, day):
+        ticker_index, day_index, values = self._state
+        row, col = ticker_index.get(ticker), day_index.get(day)
+        if row is None or col is None:
+            return np.nan
+        return values[row, col]
+
+    def get_many(self, tickers, day):
+        """Prices of tickers on one day as a 1-D array."""
+        return self.get_matrix(tickers, [day])[:, 0]
+
+    def get_matrix(self, tickers, days):
+        """Prices as a len(tickers) x len(days) array."""
+        ticker_index, day_index, values = self._state
+        rows = np.array([ticker_index.get(t, -1) for t in tickers], dtype=np.intp)
+        cols = np.array([day_index.get(d, -1) for d in days], dtype=np.intp)
+        result = np.full((len(rows), len(cols)), np.nan)
+        known_rows, known_cols = rows >= 0, cols >= 0
+        result[np.ix_(known_rows, known_cols)] = values[np.ix_(rows[known_rows], cols[known_cols])]
+        return result
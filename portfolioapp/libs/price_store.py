@@ -0,0 +1,110 @@
+import os
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prices (
+    ticker TEXT NOT NULL,
+    date TEXT NOT NULL,
+    close REAL NOT NULL,
+    PRIMARY KEY (ticker, date)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS fetched (
+    ticker TEXT NOT NULL,
+    start TEXT NOT NULL,
+    end TEXT NOT NULL,
+    PRIMARY KEY (ticker, start, end)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class PriceStore:
+    """
+    SQLite file of daily closing prices shared by the web process, the trading threads and
+    every Celery worker. Only closed days are written, since historical closes never change.
+    That holds for raw closes only: adjusted closes are rewritten by every later split or
+    dividend, so the store records which kind it holds and starts over if that changes.
+
+    """
+
+    def __init__(self, path, adjustment="raw"):
+        self.path = path
+        self.adjustment = adjustment
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        # Connections can't cross threads or a fork, so keep one per thread per process.
+        if getattr(self._local, "pid", None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+            self._check_adjustment(connection)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    def _check_adjustment(self, connection):
+        # A store written before the kind was recorded holds adjusted closes, so it's cleared too.
+        row = connection.execute("SELECT value FROM meta WHERE key = 'adjustment'").fetchone()
+        if row is None or row[0] != self.adjustment:
+            with connection:
+                connection.execute("DELETE FROM prices")
+                connection.execute("DELETE FROM fetched")
+                connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('adjustment', ?)", (self.adjustment,))
+
+    def load(self, tickers):
+        """Returns ({ticker: {date: close}}, {ticker: [(start, end), ...]}) for the given tickers."""
+        tickers = list(tickers)
+        placeholders = ",".join("?" * len(tickers))
+        prices = {ticker: {} for ticker in tickers}
+        ranges = {ticker: [] for ticker in tickers}
+        for ticker, date, close in self.connection.execute(
+            f"SELECT ticker, date, close FROM prices WHERE ticker IN ({placeholders})", tickers
+        ):
+            prices[ticker][date] = close
+        for ticker, start, end in self.connection.execute(
+            f"SELECT ticker, start, end FROM fetched WHERE ticker IN ({placeholders})", tickers
+        ):
+            ranges[ticker].append((start, end))
+        return prices, ranges
+
+    def save(self, prices, ranges):
+        """Store {ticker: {date: close}} rows and the (ticker, start, end) ranges they were fetched for."""
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO prices (ticker, date, close) VALUES (?, ?, ?)",
+                [(ticker, date, close) for ticker, days in prices.items() for date, close in days.items()],
+            )
+            self.connection.executemany("INSERT OR IGNORE INTO fetched (ticker, start, end) VALUES (?, ?, ?)", ranges)
+
+    def summary(self):
+        """Returns (ticker, rows, first date, last date) for every stored ticker."""
+        return self.connection.execute(
+            "SELECT ticker, COUNT(*), MIN(date), MAX(date) FROM prices GROUP BY ticker ORDER BY ticker"
+        ).fetchall()
+
+    def prune(self, tickers=None, before=None):
+        """
+        Delete stored prices, optionally limited to some tickers and/or to days before a date.
+        Fetched ranges touching the pruned days are dropped too so those days get downloaded again.
+
+        """
+        conditions, params = [], []
+        if tickers:
+            conditions.append(f"ticker IN ({','.join('?' * len(tickers))})")
+            params += list(tickers)
+        where = " AND ".join(conditions) or "1"
+        with self.connection:
+            if before:
+                deleted = self.connection.execute(f"DELETE FROM prices WHERE {where} AND date < ?", params + [before])
+                self.connection.execute(f"DELETE FROM fetched WHERE {where} AND start < ?", params + [before])
+            else:
+                deleted = self.connection.execute(f"DELETE FROM prices WHERE {where}", params)
+                self.connection.execute(f"DELETE FROM fetched WHERE {where}", params)
+        self.connection.execute("VACUUM")
+        return deleted.rowcount
@@ -0,0 +1,189 @@
+import json
+import mmap
+import os
+import re
+import threading
+import zlib
+from datetime import date as date_type, datetime
+from functools import lru_cache
+
+from portfolioapp.libs.price_matrix import day_number, day_string
+
+# log_data writes snapshots with indent=2, so top-level keys are the only lines
+# that start with exactly two spaces and a quote.
+TOP_LEVEL_KEY = re.compile(rb'^  "((?:[^"\\]|\\.)*)": ', re.MULTILINE)
+SLOT_NAME = re.compile(r"^(\d{2}-\d{2})\.json$")
+DAY_NAME = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+SHARD_NAME = re.compile(r"^(\d{4}-\d{2}-\d{2})\.jsonl\.gz$")
+
+
+def read_gzip_members(path):
+    """Decompress every complete gzip member in path, ignoring a member still being appended."""
+    with open(path, "rb") as f:
+        raw = f.read()
+    chunks = []
+    while raw:
+        member = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            chunk = member.decompress(raw)
+        except zlib.error:
+            break
+        if not member.eof:
+            break
+        chunks.append(chunk)
+        raw = member.unused_data
+    return b"".join(chunks)
+
+
+class SnapshotArchive:
+    """
+    Read-only index over what the log_data command captured: one compressed JSONL shard per
+    day (folder/YYYY-MM-DD.jsonl.gz) or, for older captures, one JSON snapshot per slot
+    (folder/YYYY-MM-DD/HH-MM.json, or folder/HH-MM.json dated by file mtime).
+
+    The folder is scanned once into {date: [(time, path), ...]}. A snapshot file is memory-mapped
+    the first time it is needed and its top-level keys are indexed to byte spans, so a lookup
+    decodes only the one value it returns. A shard is decompressed and indexed by
+    (key, source) the first time its day is needed.
+
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self._slots = None
+        self._shard_paths = None
+        self._shards = {}
+        self._spans = {}
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Forget the folder scan so snapshots captured since are picked up."""
+        with self._lock:
+            self._slots = None
+            self._shard_paths = None
+            self._shards = {}
+            self._spans = {}
+
+    @property
+    def slots(self):
+        if self._slots is None:
+            slots, shard_paths = {}, {}
+            for entry in os.scandir(self.folder) if os.path.isdir(self.folder) else []:
+                shard = SHARD_NAME.match(entry.name)
+                if shard:
+                    shard_paths[shard.group(1)] = entry.path
+                elif entry.is_dir() and DAY_NAME.match(entry.name):
+                    for child in os.scandir(entry.path):
+                        match = SLOT_NAME.match(child.name)
+                        if match:
+                            slots.setdefault(entry.name, []).append((match.group(1), child.path))
+                elif SLOT_NAME.match(entry.name):
+                    day = datetime.fromtimestamp(entry.stat().st_mtime).strftime("%Y-%m-%d")
+                    slots.setdefault(day, []).append((entry.name[:5], entry.path))
+            self._shard_paths = shard_paths
+            self._slots = {day: sorted(entries) for day, entries in slots.items()}
+        return self._slots
+
+    def days(self):
+        slots = self.slots
+        return sorted(set(slots) | set(self._shard_paths))
+
+    def _shard(self, day):
+        """{key: {source: [(time, value), ...]}} for a day's shard, or None if the day has no shard."""
+        self.slots  # scans the folder on first use
+        if day not in self._shard_paths:
+            return None
+        shard = self._shards.get(day)
+        if shard is None:
+            with self._lock:
+                shard = self._shards.get(day)
+                if shard is None:
+                    shard = {}
+                    for line in read_gzip_members(self._shard_paths[day]).splitlines():
+                        record = json.loads(line)
+                        shard.setdefault(record["key"], {}).setdefault(record["source"], []).append(
+                            (record["time"], record["value"])
+                        )
+                    self._shards[day] = shard
+        return shard
+
+    @staticmethod
+    def _latest(entries, time):
+        for slot, value in reversed(entries):
+            if time is None or slot <= time:
+                return value
+        return None
+
+    def _index(self, path):
+        spans = self._spans.get(path)
+        if spans is None:
+            with self._lock:
+                spans = self._spans.get(path)
+                if spans is None:
+                    spans = self._spans[path] = self._map(path)
+        return spans
+
+    @staticmethod
+    def _map(path):
+        with open(path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        starts = [(json.loads(b'"' + m.group(1) + b'"'), m.end()) for m in TOP_LEVEL_KEY.finditer(data)]
+        if not starts:
+            # Not pretty-printed, so there are no line offsets to index: parse it once instead.
+            parsed = json.loads(data[:])
+            data.close()
+            return None, parsed
+        ends = [start for _, start in starts[1:]] + [len(data)]
+        return data, {key: (start, end) for (key, start), end in zip(starts, ends)}
+
+    def _value(self, path, key):
+        data, spans = self._index(path)
+        if data is None:
+            return spans.get(key)
+        span = spans.get(key)
+        if span is None:
+            return None
+        value, _ = json.JSONDecoder().raw_decode(data[span[0] : span[1]].decode())
+        return value
+
+    def lookup(self, key, date=None, time=None):
+        """
+        The value stored under key in the latest snapshot of date taken at or before time ("HH-MM"),
+        skipping snapshots where the key is missing or recorded an error. date defaults to the
+        latest captured day and time to the end of the day.
+
+        """
+        day = day_string(day_number(date)) if date is not None else (self.days() or [None])[-1]
+        shard = self._shard(day)
+        if shard is not None and key in shard:
+            # Shards only record changes, so each source's latest record at or before time is current.
+            sources = {source: self._latest(entries, time) for source, entries in shard[key].items()}
+            if None in sources:
+                return sources[None]
+            sources = {source: value for source, value in sources.items() if value is not None}
+            return sources or None
+        for slot, path in reversed(self.slots.get(day, [])):
+            if time is not None and slot > time:
+                continue
+            value = self._value(path, key)
+            if value is not None and not (isinstance(value, dict) and "error" in value):
+                return value
+        return None
+
+    def prices(self, tickers, start, end):
+        """{ticker: {day number: price}} from MARKET_DATA_ snapshots between start and end day numbers, end exclusive."""
+        prices = {ticker: {} for ticker in tickers}
+        for day in self.days():
+            number = date_type.fromisoformat(day).toordinal()
+            if start <= number < end:
+                for ticker in tickers:
+                    value = self.lookup(f"MARKET_DATA_{ticker}", day)
+                    if value is not None:
+                        prices[ticker][number] = round(float(value["currentPrice"]), 2)
+        return prices
+
+
+@lru_cache(maxsize=None)
+def snapshot_archive(folder):
+    """One shared archive per folder, so every replay fetcher reuses the same index and mappings."""
+    return SnapshotArchive(folder)
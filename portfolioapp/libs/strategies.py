@@ -0,0 +1,222 @@
+import abc
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Dict, List
+
+import numpy as np
+
+from portfolioapp.libs.data_fetchers import stock_data_wrapper
+from portfolioapp.libs.ledger import Book
+from portfolioapp.libs.trading_calendar import trading_calendar
+
+
+@dataclass
+class MarketData:
+    """Closing prices of tickers up to and including one day, as a tickers x days array, oldest day first."""
+
+    tickers: List[str]
+    closes: np.ndarray
+
+    @property
+    def prices(self):
+        return self.closes[:, -1]
+
+    def trailing_returns(self, days):
+        """Return over the last `days` trading days per ticker, NaN where the history is too short."""
+        if self.closes.shape[1] <= days:
+            return np.full(len(self.tickers), np.nan)
+        return self.closes[:, -1] / self.closes[:, -1 - days] - 1
+
+
+@dataclass
+class PortfolioView:
+    """What a strategy sees of a portfolio: its cash and shares held per ticker."""
+
+    cash: float
+    shares: Dict[str, float] = field(default_factory=dict)
+
+    def weights(self, market):
+        """Fraction of total value held in each of market's tickers, and the total value."""
+        held = np.array([self.shares.get(t, 0.0) for t in market.tickers]) * np.nan_to_num(market.prices)
+        total = self.cash + held.sum()
+        return (held / total if total else held), total
+
+
+class Strategy(abc.ABC):
+    """
+    A rule-based trader. decide() gets the day, the portfolio and the market up to that day, and
+    returns orders in the form Portfolio.execute_orders takes, so rule-based sessions trade
+    through the same accounting as the agents. `lookback` is the trading days of history needed,
+    `name` the key sessions store and `label` what the session form shows.
+
+    """
+
+    name = None
+    label = None
+    lookback = 1
+
+    @abc.abstractmethod
+    def decide(self, date, portfolio, market):
+        raise NotImplementedError
+
+    @staticmethod
+    def rebalance(portfolio, market, target, reasoning):
+        """Orders moving the portfolio to target weights (an array over market.tickers), sells first."""
+        current, total = portfolio.weights(market)
+        prices = market.prices
+        trade_value = (np.nan_to_num(target) - current) * total
+        sells, buys = [], []
+        cash = portfolio.cash
+        for ticker, value, price, weight in zip(market.tickers, trade_value, prices, np.nan_to_num(target)):
+            if not price > 0 or abs(value) < 0.01:
+                continue
+            if value < 0:
+                held = portfolio.shares.get(ticker, 0.0)
+                # Dropping a ticker sells every share, so no dust is left behind to trade again.
+                shares = held if weight == 0 else min(-value / price, held)
+                sells.append({"action": "sell", "ticker": ticker, "shares": shares, "reasoning": reasoning})
+                cash += shares * price
+        for ticker, value, price in zip(market.tickers, trade_value, prices):
+            if not price > 0 or value < 0.01:
+                continue
+            # Round down a hair so float error never asks for more than the cash on hand.
+            value = min(value, cash) * (1 - 1e-9)
+            if value < 0.01:
+                continue
+            cash -= value
+            buys.append({"action": "buy", "ticker": ticker, "shares": value / price, "reasoning": reasoning})
+        return sells + buys
+
+
+class BuyAndHold(Strategy):
+    """Spend all cash equally across the tickers on the first day, then never trade."""
+
+    name = "buy_and_hold"
+    label = "Buy and hold"
+
+    def decide(self, date, portfolio, market):
+        if portfolio.shares:
+            return []
+        listed = ~np.isnan(market.prices)
+        target = listed / max(listed.sum(), 1)
+        return self.rebalance(portfolio, market, target, "Buy and hold: equal weight on day one")
+
+
+class EqualWeight(Strategy):
+    """
+    Hold every ticker at the same weight, rebalancing once any weight drifts from it by more than
+    `band` times the target weight.
+
+    """
+
+    name = "equal_weight"
+    label = "Equal weight"
+
+    def __init__(self, band=0.25):
+        self.band = band
+
+    def decide(self, date, portfolio, market):
+        listed = ~np.isnan(market.prices)
+        target = listed / max(listed.sum(), 1)
+        current, _ = portfolio.weights(market)
+        if np.abs(current - target).max() <= self.band * target.max():
+            return []
+        return self.rebalance(portfolio, market, target, "Equal weight: rebalance after drift")
+
+
+class Momentum(Strategy):
+    """Hold the `top` tickers by trailing `window`-day return at equal weight, trading only when that set changes."""
+
+    name = "momentum"
+    label = "Momentum"
+
+    def __init__(self, window=63, top=5):
+        self.window = window
+        self.top = top
+        self.lookback = window + 1
+
+    def decide(self, date, portfolio, market):
+        returns = market.trailing_returns(self.window)
+        ranked = np.argsort(np.where(np.isnan(returns), -np.inf, returns))[::-1]
+        leaders = [i for i in ranked[:self.top] if not np.isnan(returns[i])]
+        if not leaders:
+            return []
+        if {market.tickers[i] for i in leaders} == set(portfolio.shares):
+            return []
+        target = np.zeros(len(market.tickers))
+        target[leaders] = 1 / len(leaders)
+        return self.rebalance(portfolio, market, target, f"Momentum: top {self.top} by {self.window}-day return")
+
+
+strategies = {cls.name: cls for cls in (BuyAndHold, EqualWeight, Momentum)}
+
+
+def strategy_choices():
+    """Choices for SimulationSession.strategy: blank for the LLM agents, then every registered strategy."""
+    return [("", "LLM agents")] + [(name, cls.label) for name, cls in strategies.items()]
+
+
+@dataclass
+class SimulationResult:
+    days: list
+    equity: np.ndarray
+    trades: int
+    rejected: int
+
+    def metrics(self):
+        """Headline performance numbers over the run, from daily equity."""
+        equity = self.equity
+        returns = np.diff(equity) / equity[:-1] if len(equity) > 1 else np.array([])
+        peak = np.maximum.accumulate(equity) if len(equity) else equity
+        years = len(equity) / 252
+        volatility = returns.std() * np.sqrt(252) if len(returns) > 1 else 0.0
+        return {
+            "days": len(equity),
+            "final_value": float(equity[-1]) if len(equity) else 0.0,
+            "total_return": float(equity[-1] / equity[0] - 1) if len(equity) else 0.0,
+            "cagr": float((equity[-1] / equity[0]) ** (1 / years) - 1) if years and equity[0] else 0.0,
+            "volatility": float(volatility),
+            "sharpe": float(returns.mean() * 252 / volatility) if volatility else 0.0,
+            "max_drawdown": float((equity / peak - 1).min()) if len(equity) else 0.0,
+            "trades": self.trades,
+            "rejected": self.rejected,
+        }
+
+
+def price_history(tickers, start, end, lookback):
+    """
+    The trading days from `lookback` trading days before start through end, and the tickers' closes
+    on them from one get_matrix call, with each ticker's last close carried over days it didn't trade.
+
+    """
+    days = trading_calendar.trading_days_between(start - timedelta(days=int(lookback * 1.45) + 10), end)
+    closes = stock_data_wrapper.get_matrix(tickers, days)
+    filled = np.where(np.isnan(closes), 0, np.arange(closes.shape[1]))
+    return days, np.take_along_axis(closes, np.maximum.accumulate(filled, axis=1), axis=1)
+
+
+def simulate(strategy, tickers, start, end, cash):
+    """
+    Run a strategy over the trading days from start to end against an in-memory Book, with no
+    database. Prices for the whole run and its lookback come from one get_matrix call, and each
+    day hands the strategy a view onto that array rather than a copy.
+
+    """
+    tickers = list(tickers)
+    days, closes = price_history(tickers, start, end, strategy.lookback)
+    first = next((i for i, day in enumerate(days) if day >= start), len(days))
+    index = {ticker: i for i, ticker in enumerate(tickers)}
+    book = Book(cash)
+    equity = np.empty(len(days) - first)
+    trades = rejected = 0
+    for i in range(first, len(days)):
+        market = MarketData(tickers, closes[:, max(0, i - strategy.lookback + 1):i + 1])
+        prices = market.prices
+        for order in strategy.decide(days[i], PortfolioView(book.cash, book.positions()), market):
+            try:
+                book.fill(order["action"], order["ticker"], order["shares"], prices[index[order["ticker"]]])
+                trades += 1
+            except ValueError:
+                rejected += 1
+        equity[i - first] = book.cash + sum(shares * prices[index[t]] for t, shares in book.positions().items())
+    return SimulationResult(days=days[first:], equity=equity, trades=trades, rejected=rejected)
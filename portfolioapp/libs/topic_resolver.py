@@ -0,0 +1,94 @@
+from functools import lru_cache
+
+from fuzzywuzzy import process
+
+# Names the agent tends to use instead of a topic or ticker.
+topic_aliases = {
+    "MARKET": "STOCK MARKET NEWS",
+    "STOCKS": "STOCK MARKET NEWS",
+    "STOCK MARKET": "STOCK MARKET NEWS",
+    "POLITICS": "POLITICS NEWS",
+    "ECONOMY": "ECONOMICS NEWS",
+    "ECONOMICS": "ECONOMICS NEWS",
+    "TECH": "TECH NEWS",
+    "TECHNOLOGY": "TECH NEWS",
+    "BUSINESS": "BUSINESS NEWS",
+    "APPLE": "AAPL",
+    "MICROSOFT": "MSFT",
+    "NVIDIA": "NVDA",
+    "GOOGLE": "GOOG",
+    "ALPHABET": "GOOG",
+    "AMAZON": "AMZN",
+    "FACEBOOK": "META",
+    "BERKSHIRE": "BRK-B",
+    "BERKSHIRE HATHAWAY": "BRK-B",
+    "BRK.B": "BRK-B",
+    "BROADCOM": "AVGO",
+    "TSMC": "TSM",
+    "TAIWAN SEMICONDUCTOR": "TSM",
+    "TESLA": "TSLA",
+    "WALMART": "WMT",
+    "ELI LILLY": "LLY",
+    "LILLY": "LLY",
+    "VISA": "V",
+    "JPMORGAN": "JPM",
+    "JP MORGAN": "JPM",
+    "UNITEDHEALTH": "UNH",
+    "TENCENT": "TCEHY",
+    "MASTERCARD": "MA",
+    "EXXON": "XOM",
+    "EXXONMOBIL": "XOM",
+    "COSTCO": "COST",
+    "NETFLIX": "NFLX",
+    "PROCTER & GAMBLE": "PG",
+    "P&G": "PG",
+    "JOHNSON & JOHNSON": "JNJ",
+    "ORACLE": "ORCL",
+    "HOME DEPOT": "HD",
+    "COCA-COLA": "KO",
+    "COKE": "KO",
+}
+
+
+class TopicResolver:
+    """
+    Maps a raw query to the URL-encoded topic string used in feed URLs.
+    Exact topics and aliases are precomputed dict lookups. Anything else falls back to
+    fuzzy matching, memoized so a repeated query only pays for it once.
+
+    """
+
+    def __init__(self, topics, tickers, aliases=None, threshold=70, cache_size=4096):
+        self.topics = list(topics)
+        self.tickers = set(tickers)
+        self.threshold = threshold
+        self.exact = {topic: self.encode(topic) for topic in self.topics}
+        self.exact.update({f"MARKET_DATA_{ticker}": f"MARKET_DATA_{ticker}" for ticker in tickers})
+        for ticker in tickers:
+            self.exact.setdefault(ticker, self.encode(f"STOCK MARKET {ticker}"))
+        for alias, target in (aliases or {}).items():
+            if target in self.exact:
+                self.exact.setdefault(alias, self.exact[target])
+        self._fuzzy = lru_cache(maxsize=cache_size)(self._fuzzy_match)
+
+    @staticmethod
+    def encode(topic):
+        return topic.replace(" ", "+")
+
+    def resolve(self, query):
+        query = query.upper()
+        encoded = self.exact.get(query)
+        if encoded is not None:
+            return encoded
+        if "MARKET_DATA" in query:
+            raise ValueError(f"Invalid ticker: {query.replace('MARKET_DATA_', '')}")
+        encoded = self._fuzzy(query)
+        if encoded is None:
+            raise ValueError(f"No matching topic found for '{query}'")
+        return encoded
+
+    def _fuzzy_match(self, query):
+        match = process.extractOne(query, self.topics)
+        if match[1] < self.threshold:
+            return None
+        return self.exact[match[0]]
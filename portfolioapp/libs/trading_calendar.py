@@ -0,0 +1,62 @@
+from datetime import date, timedelta
+
+import numpy as np
+
+from portfolioapp.libs.data_fetchers import stock_data_wrapper
+from portfolioapp.libs.price_matrix import day_number
+
+
+class TradingCalendar:
+    """
+    Trading days taken from the price matrix, which is filled from the on-disk price store.
+    A day is a trading day if any ticker has a close on it, and the reference ticker's fetched
+    ranges tell us which stretches are complete, so weekends and holidays are skipped with a
+    binary search instead of trying each day against yfinance.
+
+    """
+
+    # Longest run of closed days to look across, holidays next to a weekend included.
+    lookahead = 10
+
+    def __init__(self, prices, reference_ticker="SPY"):
+        self.prices = prices
+        self.reference_ticker = reference_ticker
+
+    def _days(self, start, end):
+        self.prices.prefetch([self.reference_ticker], start, end)
+        return self.prices.prices.days
+
+    @staticmethod
+    def _shift(value, day):
+        # Keep the caller's type, so a session's simulated_date stays a datetime with its time and timezone.
+        return value + timedelta(days=day - day_number(value)) if not isinstance(value, str) else date.fromordinal(day)
+
+    def is_trading_day(self, value):
+        day = day_number(value)
+        days = self._days(day, day)
+        i = np.searchsorted(days, day)
+        return i < len(days) and days[i] == day
+
+    def next_trading_day(self, value):
+        """The first trading day after value, or None if it hasn't happened yet."""
+        day = day_number(value)
+        days = self._days(day + 1, day + self.lookahead)
+        i = np.searchsorted(days, day, side="right")
+        return self._shift(value, int(days[i])) if i < len(days) else None
+
+    def prev_trading_day(self, value):
+        """The last trading day before value."""
+        day = day_number(value)
+        days = self._days(day - self.lookahead, day - 1)
+        i = np.searchsorted(days, day, side="left")
+        return self._shift(value, int(days[i - 1])) if i > 0 else None
+
+    def trading_days_between(self, start, end):
+        """Trading days from start to end, both inclusive, as dates."""
+        first, last = day_number(start), day_number(end)
+        days = self._days(first, last)
+        window = days[np.searchsorted(days, first, side="left") : np.searchsorted(days, last, side="right")]
+        return [date.fromordinal(int(d)) for d in window]
+
+
+trading_calendar = TradingCalendar(stock_data_wrapper)
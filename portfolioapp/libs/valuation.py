@@ -0,0 +1,98 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List
+
+
+@dataclass
+class PositionValuation:
+    """All lots of one ticker, marked to a price."""
+
+    ticker: str
+    shares: float
+    cost_basis: float
+    price: float
+
+    @property
+    def market_value(self):
+        return self.shares * self.price
+
+    @property
+    def average_cost(self):
+        return self.cost_basis / self.shares if self.shares else 0.0
+
+    @property
+    def unrealized_pnl(self):
+        return self.market_value - self.cost_basis
+
+
+@dataclass
+class PortfolioValuation:
+    """Cash plus every held ticker marked to market on one date."""
+
+    cash: float
+    date: datetime
+    positions: List[PositionValuation] = field(default_factory=list)
+
+    @classmethod
+    def from_aggregates(cls, cash, date, rows, prices):
+        """Build from ticker-level (ticker, shares, cost basis) rows and their prices, in the same order."""
+        positions = [
+            PositionValuation(ticker=ticker, shares=shares, cost_basis=cost_basis, price=float(price))
+            for (ticker, shares, cost_basis), price in zip(rows, prices)
+            if shares > 0
+        ]
+        return cls(cash=cash, date=date, positions=positions)
+
+    @classmethod
+    def from_snapshot(cls, cash, date, positions):
+        """Rebuild from the cash and `snapshot_positions()` list stored for a day."""
+        return cls(cash=cash, date=date, positions=[
+            PositionValuation(ticker=p["ticker"], shares=p["shares"], cost_basis=p["cost_basis"], price=p["price"])
+            for p in positions
+        ])
+
+    @property
+    def market_value(self):
+        return sum(p.market_value for p in self.positions)
+
+    @property
+    def cost_basis(self):
+        return sum(p.cost_basis for p in self.positions)
+
+    @property
+    def unrealized_pnl(self):
+        return self.market_value - self.cost_basis
+
+    @property
+    def total_value(self):
+        return self.cash + self.market_value
+
+    def snapshot_positions(self):
+        return [
+            {
+                "ticker": p.ticker,
+                "shares": p.shares,
+                "price": p.price,
+                "market_value": p.market_value,
+                "cost_basis": p.cost_basis,
+            }
+            for p in self.positions
+        ]
+
+    def as_dict(self):
+        return {
+            "date": self.date.strftime("%Y-%m-%d") if self.date else None,
+            "cash": round(self.cash, 2),
+            "total_value": round(self.total_value, 2),
+            "positions": [
+                {
+                    "ticker": p.ticker,
+                    "shares": p.shares,
+                    "average_cost": round(p.average_cost, 2),
+                    "price": p.price,
+                    "market_value": round(p.market_value, 2),
+                    "unrealized_pnl": round(p.unrealized_pnl, 2),
+                }
+                for p in self.positions
+            ],
+        }
@@ -0,0 +1,113 @@
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from portfolioapp.libs.data_fetchers import stock_data_wrapper
+from portfolioapp.libs.features import TRADING_DAYS_PER_YEAR
+from portfolioapp.libs.LLM import start_trade_for_session
+from portfolioapp.libs.tickers import available_tickers
+from portfolioapp.libs.trading_calendar import trading_calendar
+from portfolioapp.models import Portfolio, Position, SimulationSession
+from portfolioapp.tasks import tick_key, tick_lease
+
+
+class Command(BaseCommand):
+    help = ("Run a session day after day from its simulated date (or --start) through --end without waiting "
+            "for the beat. Each day trades, values the portfolio and checkpoints the session's simulated date, "
+            "so an interrupted run picks up where it stopped when started again without --start.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("session", type=int)
+        parser.add_argument("--start", type=date.fromisoformat, help="First day (YYYY-MM-DD); resumes from the session's date if left out")
+        parser.add_argument("--end", type=date.fromisoformat, required=True, help="Last day (YYYY-MM-DD), inclusive")
+        parser.add_argument("--force", action="store_true",
+                            help="Clear a tick marker left behind by a run or task that died, and start anyway")
+
+    def handle(self, *args, **options):
+        try:
+            session = SimulationSession.objects.get(id=options["session"])
+        except SimulationSession.DoesNotExist:
+            raise CommandError(f"No session {options['session']}")
+        start = options["start"] or (session.simulated_date and session.simulated_date.date())
+        if start is None:
+            raise CommandError("The session has no simulated date, pass --start")
+        end = options["end"]
+        if end < start:
+            raise CommandError(f"Nothing to do, {start} is after {end}")
+
+        # Hold the session's tick marker so the beat leaves it alone while the backtest runs. It is a
+        # lease renewed every simulated day, so a run that gets killed frees the session on its own.
+        if options["force"]:
+            cache.delete(tick_key(session.id))
+        if not cache.add(tick_key(session.id), True, timeout=tick_lease):
+            raise CommandError(f"Session {session.id} is already being ticked, pass --force if nothing is running")
+        try:
+            self.run(session, start, end)
+        finally:
+            cache.delete(tick_key(session.id))
+
+    def run(self, session, start, end):
+        timings = defaultdict(float)
+
+        started = time.perf_counter()
+        tickers = set(available_tickers) | set(Position.objects.filter(portfolio=session.portfolio_id)
+                                               .values_list("ticker", flat=True).distinct())
+        tickers.add(trading_calendar.reference_ticker)
+        # Price history features look back a year of trading days before each day.
+        history = timedelta(days=int(TRADING_DAYS_PER_YEAR * 1.45) + 10) if session.use_price_history else timedelta(days=1)
+        stock_data_wrapper.prefetch(sorted(tickers), start - history, end + timedelta(days=trading_calendar.lookahead))
+        days = trading_calendar.trading_days_between(start, end)
+        timings["prefetch"] = time.perf_counter() - started
+        self.stdout.write(f"Session {session.id}: {len(days)} trading days from {start} to {end}, "
+                          f"prices ready in {timings['prefetch']:.2f}s")
+
+        stage = "Adjust" if session.logs.exists() else "Start"
+        run_started = time.perf_counter()
+        for i, day in enumerate(days):
+            session.simulated_date = datetime.combine(day, datetime.min.time(), tzinfo=timezone.utc)
+            SimulationSession.objects.filter(id=session.id).update(simulated_date=session.simulated_date)
+
+            # Trading and the checkpoint below commit separately, so a run killed between them resumes on
+            # a day that already traded. Its trades stand: the day is only valued and checkpointed again.
+            step = {}
+            started = time.perf_counter()
+            midnight = session.simulated_date
+            if session.logs.filter(timestamp__gte=midnight, timestamp__lt=midnight + timedelta(days=1)).exists():
+                self.stdout.write(f"{day}  already traded, resuming after its trades")
+            else:
+                start_trade_for_session(session.id, stage)
+            step["trade"] = time.perf_counter() - started
+            stage = "Adjust"
+
+            started = time.perf_counter()
+            portfolio = Portfolio.objects.select_related("session").get(pk=session.portfolio_id)
+            valuation = portfolio.get_valuation()
+            step["value"] = time.perf_counter() - started
+
+            # The day is done once its value is logged and the session points at the next day.
+            started = time.perf_counter()
+            next_day = days[i + 1] if i + 1 < len(days) else trading_calendar.next_trading_day(day)
+            with transaction.atomic():
+                portfolio.log_portfolio_value(valuation)
+                if next_day is not None:
+                    SimulationSession.objects.filter(id=session.id).update(
+                        simulated_date=datetime.combine(next_day, datetime.min.time(), tzinfo=timezone.utc)
+                    )
+            step["checkpoint"] = time.perf_counter() - started
+            cache.touch(tick_key(session.id), tick_lease)
+
+            for name, elapsed in step.items():
+                timings[name] += elapsed
+            self.stdout.write(f"{day}  " + "  ".join(f"{name} {elapsed:6.2f}s" for name, elapsed in step.items())
+                              + f"  total {valuation.total_value:>12,.2f}")
+
+        elapsed = time.perf_counter() - run_started
+        self.stdout.write(self.style.SUCCESS(
+            f"Simulated {len(days)} days in {elapsed:.1f}s ({len(days) / elapsed if elapsed else 0:.1f} days/s)"
+        ))
+        for name, total in timings.items():
+            per_day = f", {total / len(days):.3f}s per day" if days and name != "prefetch" else ""
+            self.stdout.write(f"  {name:<10} {total:8.2f}s{per_day}")
@@ -0,0 +1,158 @@
+import time
+import timeit
+from datetime import date, datetime, timedelta, timezone
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from fuzzywuzzy import process
+from portfolioapp.libs.data_fetchers import topics, topic_resolver, stock_data_wrapper
+from portfolioapp.libs.price_matrix import day_number
+from portfolioapp.libs.strategies import price_history, simulate, strategies
+from portfolioapp.libs.tickers import available_tickers
+from portfolioapp.models import Portfolio, Position, SimulationSession, TradeLog
+
+
+def legacy_resolve(query):
+    """How DataFetcher.fetch mapped a query to a topic before the precompiled resolver."""
+    query = query.upper()
+    if query not in topics:
+        if "MARKET_DATA" in query:
+            ticker_part = query.replace("MARKET_DATA_", "")
+            if ticker_part not in available_tickers:
+                raise ValueError(f"Invalid ticker: {ticker_part}")
+        elif query in available_tickers:
+            query = f"STOCK MARKET {query}"
+        else:
+            match = process.extractOne(query, topics)
+            if match[1] < 70:
+                raise ValueError(f"No matching topic found for '{query}'")
+            query = match[0]
+    return query.replace(" ", "+")
+
+
+def legacy_sell(portfolio, ticker, shares, session, price):
+    """How Portfolio.sell_stock consumed lots before it was made transactional and bulk."""
+    total = sum(p.shares for p in portfolio.holdings.filter(ticker=ticker))
+    if shares > total:
+        raise ValueError("Not enough shares")
+    remaining = shares
+    profit = 0
+    for p in portfolio.holdings.filter(ticker=ticker).order_by("purchase_timestamp"):
+        if p.shares <= remaining:
+            remaining -= p.shares
+            profit += (price - p.share_price_at_purchase) * p.shares
+            portfolio.cash += p.shares * price
+            p.delete()
+        else:
+            p.shares -= remaining
+            profit += (price - p.share_price_at_purchase) * remaining
+            portfolio.cash += remaining * price
+            remaining = 0
+            portfolio.save()
+            p.save()
+            break
+    portfolio.save()
+    TradeLog.objects.create(session=session, action="sell", symbol=ticker, shares=shares, total_price=shares * price,
+                            share_price=price, profit=profit, timestamp=session.simulated_date)
+
+
+class Rollback(Exception):
+    pass
+
+
+def seed_session(name, prices, lots, date, cash=0, cost=None, lot_dates=None):
+    """
+    A throwaway session holding `lots` one-share lots of each ticker in `prices`, bought at `cost` (the ticker's
+    price if not given) on `lot_dates` in turn (`date` if not given), and priced locally on `date` so nothing hits
+    the network.
+    """
+    stock_data_wrapper.prices.update({ticker: {day_number(date): price} for ticker, price in prices.items()})
+    user = User.objects.create(username=f"{name}-{time.time_ns()}")
+    portfolio = Portfolio.objects.create(cash=cash)
+    session = SimulationSession.objects.create(user=user, portfolio=portfolio, amount=cash, name=user.username,
+                                               simulated_date=date)
+    lot_dates = lot_dates or [date]
+    Position.objects.bulk_create(
+        Position(portfolio=portfolio, session=session, ticker=ticker, shares=1,
+                 share_price_at_purchase=price if cost is None else cost, purchase_timestamp=lot_dates[n % len(lot_dates)])
+        for ticker, price in prices.items() for n in range(lots)
+    )
+    return Portfolio.objects.get(pk=portfolio.pk), session
+
+
+def quietly(resolve, query):
+    try:
+        return resolve(query)
+    except ValueError:
+        return None
+
+
+class Command(BaseCommand):
+    help = "Time hot code paths against how they used to work"
+
+    def add_arguments(self, parser):
+        parser.add_argument("target", choices=["topics", "sell", "strategies"])
+        parser.add_argument("--number", type=int, default=1000, help="Repetitions per measurement")
+        parser.add_argument("--lots", type=int, default=5000, help="Lots held by the synthetic session")
+        parser.add_argument("--years", type=int, default=5, help="Years of trading days each strategy simulates")
+
+    def handle(self, *args, **options):
+        getattr(self, f"bench_{options['target']}")(options)
+
+    def report(self, name, before, after, number):
+        self.stdout.write(
+            f"{name:<28} before {before / number * 1e6:>9.1f} us  after {after / number * 1e6:>9.1f} us  "
+            f"({before / after:.0f}x)"
+        )
+
+    def bench_topics(self, options):
+        number = options["number"]
+        # What an agent asks for: exact topics, tickers, company names and loose phrasings.
+        # The legacy path rejects company names, and a rejection costs as much as a match.
+        queries = ["STOCK MARKET NEWS", "aapl", "MARKET_DATA_MSFT", "tech", "apple", "economy news", "politic"]
+        for query in queries:
+            before = timeit.timeit(lambda: quietly(legacy_resolve, query), number=number)
+            after = timeit.timeit(lambda: quietly(topic_resolver.resolve, query), number=number)
+            self.report(repr(query), before, after, number)
+
+    def bench_sell(self, options):
+        # Sell all but half a share, so every lot but one is consumed and the last is split.
+        lots, ticker, price = options["lots"], available_tickers[0], 100.0
+        date = datetime(2025, 1, 15, tzinfo=timezone.utc)
+        timings = {}
+        for name in ("before", "after"):
+            try:
+                with transaction.atomic():
+                    portfolio, session = seed_session("benchmark", {ticker: price}, lots, date)
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        if name == "before":
+                            legacy_sell(portfolio, ticker, lots - 0.5, session, price)
+                        else:
+                            portfolio.sell_stock(ticker, lots - 0.5, session)
+                        timings[name] = (time.perf_counter() - started, len(queries))
+                    raise Rollback
+            except Rollback:
+                pass
+        (before, before_queries), (after, after_queries) = timings["before"], timings["after"]
+        self.stdout.write(
+            f"sell {lots - 0.5} shares over {lots} lots: before {before * 1000:.0f} ms / {before_queries} queries, "
+            f"after {after * 1000:.0f} ms / {after_queries} queries ({before / after:.0f}x)"
+        )
+
+    def bench_strategies(self, options):
+        end = date.today() - timedelta(days=1)
+        start = end - timedelta(days=365 * options["years"])
+        # Warm the price cache first, so the timings are the simulation and not the download.
+        price_history(available_tickers, start, end, max(strategy().lookback for strategy in strategies.values()))
+        for name, strategy in strategies.items():
+            started = time.perf_counter()
+            result = simulate(strategy(), available_tickers, start, end, 10000)
+            elapsed = time.perf_counter() - started
+            metrics = result.metrics()
+            self.stdout.write(
+                f"{name:<14} {metrics['days']} days in {elapsed * 1000:.0f} ms ({metrics['days'] / elapsed:,.0f} days/s)  "
+                f"{metrics['trades']} trades, return {metrics['total_return']:+.1%}"
+            )
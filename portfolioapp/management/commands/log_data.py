@@ -1,11 +1,12 @@
 import os
+import gzip
 import json
 import time
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 
 from django.core.management.base import BaseCommand
 from portfolioapp.libs.tickers import available_tickers
-from portfolioapp.libs.data_fetchers import DataFetcher, google_url, twitter_url
+from portfolioapp.libs.data_fetchers import DataFetcher, StockDataWrapper, google_url, twitter_url, fetch_concurrently
 
 
 class Command(BaseCommand):
@@ -18,51 +19,77 @@ class Command(BaseCommand):
             default="daily_data",
             help="Folder to save fetched data"
         )
+        parser.add_argument("--once", action="store_true", help="Capture a single slot and exit")
 
     def handle(self, *args, **options):
         folder = options["folder"]
         os.makedirs(folder, exist_ok=True)
 
-        google_fetcher = DataFetcher(type="url", url=google_url)
-        twitter_fetcher = DataFetcher(type="url", url=twitter_url)
+        fetchers = {
+            "google": DataFetcher(type="url", url=google_url),
+            "twitter": DataFetcher(type="url", url=twitter_url),
+        }
 
-        ticker_topics = [f"STOCK MARKET {ticker}" for ticker in available_tickers]
-        topics = ["STOCK MARKET NEWS", "POLITICS NEWS", "ECONOMICS NEWS", "TECH NEWS", "BUSINESS NEWS"] + ticker_topics
+        # Record key -> query. Tickers are queried the way the trading agent asks for them and
+        # recorded under "STOCK MARKET <ticker>", which is where replay looks them up.
+        topics = {topic: topic for topic in ["STOCK MARKET NEWS", "POLITICS NEWS", "ECONOMICS NEWS", "TECH NEWS", "BUSINESS NEWS"]}
+        topics.update({f"STOCK MARKET {ticker}": ticker for ticker in available_tickers})
+        # Last value written per (key, source), so unchanged feeds and prices are skipped.
+        self.last_written = {}
 
-        
         start_time = datetime.now()
         end_time = start_time.replace(hour=17, minute=0, second=0, microsecond=0)
         if datetime.now() >= end_time:
             end_time += timedelta(days=1)
 
         while datetime.now() < end_time:
-            now = datetime.now()
-            minutes = (now.minute // 10) * 10
-            timestamp = f"{now.hour:02d}-{minutes:02d}"
-            data = {}
+            self.capture(folder, fetchers, topics)
+            if options["once"]:
+                break
+            sleep_seconds = 600 - (datetime.now().timestamp() % 600)
+            time.sleep(sleep_seconds)
 
-            for topic in topics:
-                try:
-                    google_results = google_fetcher.fetch(topic)
-                    twitter_results = twitter_fetcher.fetch(topic)
-                    data[topic.upper()] = {
-                        "google": google_results,
-                        "twitter": twitter_results
-                    }
-                except Exception as e:
-                    data[topic.upper()] = {"error": str(e)}
+    def capture(self, folder, fetchers, topics):
+        now = datetime.now()
+        minutes = (now.minute // 10) * 10
+        timestamp = f"{now.hour:02d}-{minutes:02d}"
+        started = time.monotonic()
 
-            for ticker in available_tickers:
-                try:
-                    data[f"MARKET_DATA_{ticker}"] = google_fetcher.fetch_market_data(ticker)
-                except Exception as e:
-                    data[f"MARKET_DATA_{ticker}"] = {"error": str(e)}
+        jobs = {
+            (key, source): (fetcher, query, {})
+            for key, query in topics.items()
+            for source, fetcher in fetchers.items()
+        }
+        records, unchanged = [], 0
+        outcomes, errors = fetch_concurrently(jobs, method="fetch_if_changed")
+        for (key, source), (changed, result) in outcomes.items():
+            if changed:
+                records.append({"time": timestamp, "key": key, "source": source, "value": result})
+            else:
+                unchanged += 1
 
-            filepath = os.path.join(folder, f"{timestamp}.json")
-            with open(filepath, "w") as f:
-                json.dump(data, f, indent=2)
+        today = date.today().toordinal()
+        try:
+            prices = StockDataWrapper.download(available_tickers, today, today + 1)
+        except Exception as e:
+            self.stderr.write(f"Market data fetch failed: {e}")
+            prices = {}
+        for ticker, days in prices.items():
+            if today in days:
+                records.append({"time": timestamp, "key": f"MARKET_DATA_{ticker}", "source": None,
+                                "value": {"currentPrice": days[today]}})
 
-            self.stdout.write(f"[{now.strftime('%H:%M')}] Logged data to {filepath}")
+        records = [r for r in records if self.last_written.get((r["key"], r["source"])) != r["value"]]
+        for record in records:
+            self.last_written[(record["key"], record["source"])] = record["value"]
 
-            sleep_seconds = 600 - (datetime.now().timestamp() % 600)
-            time.sleep(sleep_seconds)
+        # One gzip member per slot appended to the day's shard; readers decode members back to back.
+        filepath = os.path.join(folder, f"{now.strftime('%Y-%m-%d')}.jsonl.gz")
+        if records:
+            with gzip.open(filepath, "at", encoding="utf-8") as f:
+                f.writelines(json.dumps(record, separators=(",", ":")) + "\n" for record in records)
+
+        self.stdout.write(
+            f"[{now.strftime('%H:%M')}] Logged {len(records)} records to {filepath} "
+            f"({unchanged} unchanged, {len(errors)} failed) in {time.monotonic() - started:.1f}s"
+        )
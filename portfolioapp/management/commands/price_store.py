@@ -0,0 +1,47 @@
+import os
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from portfolioapp.libs.tickers import available_tickers
+from portfolioapp.libs.data_fetchers import stock_data_wrapper
+
+
+class Command(BaseCommand):
+    help = "Inspect, warm or prune the on-disk price store"
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["inspect", "warm", "prune"])
+        parser.add_argument(
+            "--tickers",
+            type=str,
+            default="",
+            help="Comma separated tickers (defaults to all available tickers when warming)"
+        )
+        parser.add_argument("--start", type=str, help="First day to warm, YYYY-MM-DD (defaults to one year ago)")
+        parser.add_argument("--end", type=str, help="Last day to warm, YYYY-MM-DD (defaults to yesterday)")
+        parser.add_argument("--before", type=str, help="Prune only days before this date, YYYY-MM-DD")
+
+    def handle(self, *args, **options):
+        store = stock_data_wrapper.store
+        if store is None:
+            raise CommandError("No price store is configured")
+        tickers = [t.strip().upper() for t in options["tickers"].split(",") if t.strip()]
+
+        if options["action"] == "inspect":
+            rows = store.summary()
+            for ticker, count, first, last in rows:
+                self.stdout.write(f"{ticker:<8} {count:>6} days  {first} -> {last}")
+            size = os.path.getsize(store.path) if os.path.exists(store.path) else 0
+            self.stdout.write(f"{len(rows)} tickers, {sum(r[1] for r in rows)} prices, {size / 1024:.0f} KiB at {store.path}")
+
+        elif options["action"] == "warm":
+            end = options["end"] or (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+            start = options["start"] or (datetime.now() - timedelta(days=365)).strftime("%Y-%m-%d")
+            stock_data_wrapper.prefetch(tickers or available_tickers, start, end)
+            self.stdout.write(self.style.SUCCESS(f"Warmed {len(tickers or available_tickers)} tickers from {start} to {end}"))
+
+        elif options["action"] == "prune":
+            if not tickers and not options["before"]:
+                raise CommandError("Pass --tickers and/or --before to choose what to prune")
+            deleted = store.prune(tickers=tickers, before=options["before"])
+            self.stdout.write(self.style.SUCCESS(f"Pruned {deleted} prices"))
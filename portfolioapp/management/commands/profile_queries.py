@@ -0,0 +1,146 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from portfolioapp import session_cache, views
+from portfolioapp.libs.tickers import available_tickers
+from portfolioapp.management.commands.benchmark import Rollback, seed_session
+from portfolioapp.models import Portfolio, PortfolioLog, PortfolioSnapshot, TradeLog
+from portfolioapp.profiling import counted_queries
+
+# Views that can't run against a synthetic session, and why.
+SKIPPED_VIEWS = {
+    "stock_search_api": "looks tickers up on Yahoo Finance",
+    "buy": "acts on the first portfolio in the database, not a session",
+    "sell": "acts on the first portfolio in the database, not a session",
+}
+
+
+class Command(BaseCommand):
+    help = ("Seed a large synthetic session, run every view and Portfolio method against it and report "
+            "query counts and timings. Fails if any code path goes over its declared query budget.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tickers", type=int, default=20, help="Tickers held by the synthetic session")
+        parser.add_argument("--lots", type=int, default=200, help="Lots held per ticker")
+        parser.add_argument("--trades", type=int, default=5000, help="TradeLog rows")
+        parser.add_argument("--days", type=int, default=750, help="Simulated days of value history")
+
+    def handle(self, *args, **options):
+        results = []
+        # Budgets are checked here rather than raised mid-run, so one report covers every overrun.
+        with override_settings(ENFORCE_QUERY_BUDGETS=False):
+            try:
+                with transaction.atomic():
+                    session = self.seed_session(options)
+                    results += self.profile_portfolio(session, options)
+                    results += self.profile_views(session)
+                    raise Rollback
+            except Rollback:
+                # The session's id can be handed out again, so its cached responses must not outlive it.
+                session_cache.bump(session.id)
+
+        over = []
+        self.stdout.write(f"{'code path':<40} {'queries':>7} {'budget':>6} {'ms':>9}")
+        for name, queries, budget, elapsed in results:
+            line = f"{name:<40} {len(queries):>7} {budget if budget is not None else '-':>6} {elapsed * 1000:>9.1f}"
+            if budget is not None and len(queries) > budget:
+                over.append((name, queries, budget))
+                line = self.style.ERROR(line)
+            self.stdout.write(line)
+        for name, reason in SKIPPED_VIEWS.items():
+            self.stdout.write(f"{name:<40} skipped, {reason}")
+
+        if over:
+            for name, queries, budget in over:
+                self.stderr.write(f"\n{name} ran {len(queries)} queries, its budget is {budget}:\n" + "\n".join(queries))
+            raise CommandError(f"{len(over)} code paths over their query budget")
+        self.stdout.write(self.style.SUCCESS("All code paths within their query budgets"))
+
+    def seed_session(self, options):
+        """A session with lots, trades and value history at the requested sizes, priced locally so nothing hits the network."""
+        tickers = available_tickers[:options["tickers"]]
+        date = datetime(2025, 1, 15, tzinfo=timezone.utc)
+        days = [date - timedelta(days=n) for n in range(options["days"])][::-1]
+        portfolio, session = seed_session("profile", {ticker: 100.0 + i for i, ticker in enumerate(tickers)},
+                                          options["lots"], date, cash=1_000_000, cost=90.0, lot_dates=days)
+        TradeLog.objects.bulk_create(
+            TradeLog(session=session, action="buy", symbol=tickers[n % len(tickers)], shares=1, total_price=90.0,
+                     share_price=90.0, profit=0, timestamp=days[n % len(days)], reasoning="Synthetic")
+            for n in range(options["trades"])
+        )
+        PortfolioLog.objects.bulk_create(
+            PortfolioLog(portfolio=portfolio, timestamp=day, total_value=1_000_000) for day in days
+        )
+        PortfolioSnapshot.objects.bulk_create(
+            PortfolioSnapshot(portfolio=portfolio, date=day.date(), total_value=1_000_000) for day in days
+        )
+        self.stdout.write(f"Seeded {len(tickers)} tickers x {options['lots']} lots, {options['trades']} trades, "
+                          f"{len(days)} days of history")
+        return session
+
+    def measure(self, name, call, budget):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            call()
+            elapsed = time.perf_counter() - started
+        return name, counted_queries(captured.captured_queries), budget, elapsed
+
+    def profile_portfolio(self, session, options):
+        # Each call gets a fresh instance, as a request or task would, so lazily loaded relations count.
+        ticker = available_tickers[0]
+        # Sizes follow --lots so each sell consumes whole lots and splits one, however many lots there are.
+        lots = options["lots"]
+        # Ten trades: sell part of five holdings, put the proceeds into the other five.
+        held = available_tickers[:10]
+        rebalance = ([{"action": "sell", "ticker": t, "shares": lots / 4 + 0.5} for t in held[:5]]
+                     + [{"action": "buy", "ticker": t, "shares": 10} for t in held[5:]])
+        cases = [
+            ("get_valuation", lambda p: p.get_valuation()),
+            ("get_total_value", lambda p: p.get_total_value()),
+            ("replay_cash", lambda p: p.replay_cash()),
+            ("reconcile_cash", lambda p: p.reconcile_cash(fix=True)),
+            ("log_portfolio_value", lambda p: p.log_portfolio_value()),
+            ("get_snapshot", lambda p: p.get_snapshot()),
+            ("buy_stock", lambda p: p.buy_stock(ticker, 1, session.id)),
+            ("get_snapshot (after a trade)", lambda p: p.get_snapshot()),
+            ("sell_stock", lambda p: p.sell_stock(ticker, lots / 2 + 0.5, session)),
+            ("execute_orders", lambda p: p.execute_orders(rebalance)),
+            ("save_snapshot", lambda p: p.save_snapshot(valuation)),
+        ]
+        valuation = Portfolio.objects.get(pk=session.portfolio_id).get_valuation()
+        results = []
+        for name, call in cases:
+            method = getattr(Portfolio, name.split()[0])
+            portfolio = Portfolio.objects.get(pk=session.portfolio_id)
+            results.append(self.measure(f"Portfolio.{name}", lambda: call(portfolio),
+                                        getattr(method, "query_budget", None)))
+        return results
+
+    def profile_views(self, session):
+        factory = RequestFactory()
+        user = session.user
+        pk = session.id
+        cases = [
+            ("session_list", {}),
+            ("create_session", {}),
+            ("view_session", {"pk": pk}),
+            ("chat_log_api", {}),
+            ("search_stocks", {}),
+            ("get_holdings", {"pk": pk}),
+            ("get_trades", {"pk": pk}),
+            ("portfolio_value_data", {"pk": pk}),
+            ("value_over_time", {"pk": pk}),
+            ("delete_session", {"pk": pk}),
+        ]
+        results = []
+        for name, kwargs in cases:
+            view = getattr(views, name)
+            request = factory.get("/", {"q": "A"})
+            request.user = user
+            results.append(self.measure(f"views.{name}", lambda: view(request, **kwargs),
+                                        getattr(view, "query_budget", None)))
+        return results
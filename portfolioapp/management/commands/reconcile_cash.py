@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from portfolioapp.models import SimulationSession
+
+
+class Command(BaseCommand):
+    help = "Check each portfolio's running cash balance against a full replay of its trade log"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--session", type=int, help="Only check this session id")
+        parser.add_argument("--fix", action="store_true", help="Overwrite drifted balances with the replayed value")
+        parser.add_argument("--tolerance", type=float, default=0.01, help="Drift allowed before a balance is reported")
+
+    def handle(self, *args, **options):
+        sessions = SimulationSession.objects.select_related("portfolio").order_by("id")
+        if options["session"]:
+            sessions = sessions.filter(id=options["session"])
+
+        drifted = 0
+        for session in sessions:
+            portfolio = session.portfolio
+            cash = portfolio.cash
+            expected, drift = portfolio.reconcile_cash(fix=options["fix"], tolerance=options["tolerance"])
+            if abs(drift) > options["tolerance"]:
+                drifted += 1
+                action = "fixed" if options["fix"] else "drifted"
+                self.stdout.write(
+                    self.style.WARNING(f"Session {session.id} ({session.name}): {action}, ledger {cash:.2f}, "
+                                       f"replay {expected:.2f}, drift {drift:+.2f}")
+                )
+
+        if drifted:
+            self.stdout.write(f"{drifted} of {sessions.count()} portfolios drifted")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"All {sessions.count()} portfolios reconcile"))
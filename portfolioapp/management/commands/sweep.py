@@ -0,0 +1,93 @@
+import importlib.util
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from portfolioapp.libs.strategies import price_history, simulate, strategies
+from portfolioapp.libs.tickers import available_tickers
+
+
+def run(config):
+    """One grid point, in a worker process: simulate against an in-memory Book and return its metrics."""
+    started = time.perf_counter()
+    result = simulate(strategies[config["strategy"]](), config["tickers"].split(","), config["start"],
+                      config["end"], config["amount"])
+    return {**config, **result.metrics(), "seconds": time.perf_counter() - started}
+
+
+class Command(BaseCommand):
+    help = ("Simulate every combination of strategy, starting amount and ticker subset from --start to --end "
+            "in a pool of worker processes, and write one row of summary metrics per run to a Parquet file. "
+            "Runs use the rule-based strategies; LLM sessions need the database and the agents, so run those "
+            "with backtest.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", type=date.fromisoformat, required=True, help="First day (YYYY-MM-DD)")
+        parser.add_argument("--end", type=date.fromisoformat, required=True, help="Last day (YYYY-MM-DD), inclusive")
+        parser.add_argument("--strategies", default=",".join(strategies), help="Comma-separated strategy names")
+        parser.add_argument("--amounts", default="10000", help="Comma-separated starting amounts")
+        parser.add_argument("--tickers", action="append",
+                            help="Comma-separated ticker subset, repeat for more subsets; all tickers if left out")
+        parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes, one per core by default")
+        parser.add_argument("--output", default="sweep.parquet",
+                            help="Parquet file to write, or CSV if the name ends in .csv or no Parquet engine is installed")
+
+    def handle(self, *args, **options):
+        start, end = options["start"], options["end"]
+        if end < start:
+            raise CommandError(f"Nothing to do, {start} is after {end}")
+        names = [s.strip() for s in options["strategies"].split(",") if s.strip()]
+        unknown = [s for s in names if s not in strategies]
+        if unknown:
+            raise CommandError(f"Unknown strategies {', '.join(unknown)}, choose from {', '.join(strategies)}")
+        try:
+            amounts = [float(a) for a in options["amounts"].split(",")]
+        except ValueError:
+            raise CommandError("--amounts must be comma-separated numbers")
+        subsets = []
+        for subset in options["tickers"] or [",".join(available_tickers)]:
+            tickers = [t.strip().upper() for t in subset.split(",") if t.strip()]
+            invalid = [t for t in tickers if t not in available_tickers]
+            if invalid or not tickers:
+                raise CommandError(f"Invalid ticker subset {subset!r}")
+            subsets.append(",".join(tickers))
+
+        # Settle the output format before the grid runs, not after.
+        output = options["output"]
+        if not output.endswith(".csv") and not any(importlib.util.find_spec(engine) for engine in ("pyarrow", "fastparquet")):
+            output = os.path.splitext(output)[0] + ".csv"
+            self.stderr.write(f"No Parquet engine installed (pip install pyarrow), writing {output} instead")
+
+        configs = [{"strategy": name, "amount": amount, "tickers": tickers, "start": start, "end": end}
+                   for name, amount, tickers in itertools.product(names, amounts, subsets)]
+
+        # Fill the shared price store once, so the workers only read it.
+        started = time.perf_counter()
+        every_ticker = sorted({t for subset in subsets for t in subset.split(",")})
+        price_history(every_ticker, start, end, max(strategies[name]().lookback for name in names))
+        self.stdout.write(f"{len(configs)} runs on {options['workers']} workers, "
+                          f"prices ready in {time.perf_counter() - started:.2f}s")
+
+        # Workers never touch the database, and a forked connection must not be shared with them.
+        connections.close_all()
+        started = time.perf_counter()
+        chunksize = max(1, len(configs) // (options["workers"] * 4))
+        with ProcessPoolExecutor(max_workers=options["workers"]) as pool:
+            rows = list(pool.map(run, configs, chunksize=chunksize))
+        elapsed = time.perf_counter() - started
+
+        results = pd.DataFrame(rows)
+        if output.endswith(".csv"):
+            results.to_csv(output, index=False)
+        else:
+            results.to_parquet(output, index=False)
+        days = sum(row["days"] for row in rows)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {len(rows)} runs to {output} in {elapsed:.1f}s "
+            f"({len(rows) / elapsed:.1f} runs/s, {days / elapsed:,.0f} simulated days/s)"
+        ))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2025-04-22 01:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolioapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tradelog',
+            name='reasoning',
+            field=models.TextField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,14 @@
+# Generated by Django 5.2 on 2025-04-22 18:27
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolioapp', '0002_add_name'),
+        ('portfolioapp', '0002_tradelog_reasoning'),
+    ]
+
+    operations = [
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2 on 2026-10-18 10:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_from_logs(apps, schema_editor):
+    """Seed one snapshot per portfolio and day from the latest PortfolioLog of that day."""
+    PortfolioLog = apps.get_model("portfolioapp", "PortfolioLog")
+    PortfolioSnapshot = apps.get_model("portfolioapp", "PortfolioSnapshot")
+    seen = set()
+    snapshots = []
+    logs = PortfolioLog.objects.order_by("portfolio_id", "-timestamp").values_list("portfolio_id", "timestamp", "total_value")
+    for portfolio_id, timestamp, total_value in logs.iterator():
+        key = (portfolio_id, timestamp.date())
+        if key in seen:
+            continue
+        seen.add(key)
+        snapshots.append(PortfolioSnapshot(portfolio_id=portfolio_id, date=key[1], total_value=total_value))
+    PortfolioSnapshot.objects.bulk_create(snapshots, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolioapp', '0005_simulationsession_simulated_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PortfolioSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('cash', models.FloatField(blank=True, null=True)),
+                ('total_value', models.FloatField()),
+                ('positions', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('portfolio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='portfolioapp.portfolio')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('portfolio', 'date'), name='unique_portfolio_snapshot_date')],
+            },
+        ),
+        migrations.RunPython(backfill_from_logs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolioapp', '0006_portfoliosnapshot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='position',
+            index=models.Index(fields=['portfolio', 'ticker', 'purchase_timestamp'], name='position_lots_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='portfoliolog',
+            index=models.Index(fields=['portfolio', 'timestamp'], name='portfoliolog_series_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tradelog',
+            index=models.Index(fields=['session', 'timestamp'], name='tradelog_session_time_idx'),
+        ),
+    ]
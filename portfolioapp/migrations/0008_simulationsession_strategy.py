@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 14:05
+
+from django.db import migrations, models
+import portfolioapp.libs.strategies
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolioapp', '0007_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='simulationsession',
+            name='strategy',
+            field=models.CharField(blank=True, choices=portfolioapp.libs.strategies.strategy_choices, default='', max_length=32),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 08:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolioapp', '0008_simulationsession_strategy'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='portfoliolog',
+            name='timestamp',
+            field=models.DateTimeField(),
+        ),
+        migrations.AlterField(
+            model_name='position',
+            name='purchase_timestamp',
+            field=models.DateTimeField(),
+        ),
+        migrations.AlterField(
+            model_name='tradelog',
+            name='timestamp',
+            field=models.DateTimeField(),
+        ),
+    ]
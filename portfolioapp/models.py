@@ -1,7 +1,17 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Sum
 import time
+import logging
+import numpy as np
+from functools import partial
 from portfolioapp.libs.data_fetchers import stock_data_wrapper
+from portfolioapp.libs.price_matrix import day_number
+from portfolioapp.libs.valuation import PortfolioValuation
+from portfolioapp.libs.ledger import Book, Lot, consume_fifo
+from portfolioapp.libs.strategies import strategy_choices
 from portfolioapp.libs.tickers import available_tickers
+from portfolioapp.profiling import query_budget
+from portfolioapp import session_cache
 from django.contrib.auth.models import User
 
 
@@ -17,33 +27,167 @@ class Portfolio(models.Model):
     cash = models.FloatField()
     created_at = models.DateTimeField(auto_now_add=True)
 
-    def get_and_update_cash(self):
-        cash = self.session.amount
-        for trade in self.session.logs.all():
-            if trade.action == "buy":
-                cash -= trade.total_price
-            elif trade.action == "sell":
-                cash += trade.total_price
-        self.cash = cash
-        self.save()
-        return cash
+    # cash is a running balance: every trade adjusts it with an F() update in the trade's own
+    # transaction, so reading it never means replaying the TradeLog. reconcile_cash checks it.
 
+    @query_budget(2)
+    def replay_cash(self):
+        """Cash implied by the session's starting amount and its whole TradeLog."""
+        totals = dict(self.session.logs.values_list("action").annotate(total=Sum("total_price")))
+        return self.session.amount - totals.get("buy", 0) + totals.get("sell", 0)
+
+    @query_budget(3)
+    def reconcile_cash(self, fix=False, tolerance=0.01):
+        """Compare the running balance with a full replay and return (replayed cash, drift), correcting it if fix."""
+        expected = self.replay_cash()
+        drift = self.cash - expected
+        if fix and abs(drift) > tolerance:
+            Portfolio.objects.filter(pk=self.pk).update(cash=expected)
+            self.cash = expected
+        return expected, drift
+
+    @query_budget(2)
+    def get_valuation(self):
+        """
+        Value the portfolio on its session's simulated date: lots are summed per ticker in the
+        database and the distinct tickers are priced in one batched lookup.
+
+        """
+        rows = list(
+            self.holdings.values("ticker")
+            .annotate(total_shares=Sum("shares"), cost_basis=Sum(F("shares") * F("share_price_at_purchase")))
+            .order_by("ticker")
+            .values_list("ticker", "total_shares", "cost_basis")
+        )
+        date = self.session.simulated_date
+        prices = stock_data_wrapper.get_many([row[0] for row in rows], date) if rows else []
+        return PortfolioValuation.from_aggregates(self.cash, date, rows, prices)
+
+    @query_budget(2)
     def get_total_value(self):
-        
-        value = self.get_and_update_cash()
+        return self.get_valuation().total_value
 
-        for pos in self.holdings.all():
-            current_price = stock_data_wrapper.get(pos.ticker, self.session.simulated_date)
-            value += pos.shares * current_price
-        return value
+    @query_budget(4)
+    def get_snapshot(self):
+        """
+        Valuation on the simulated date, served from that day's snapshot when there is one.
+        On a miss (a new day, a trade since the snapshot was written, or a row backfilled without
+        cash) it is computed and stored.
 
-    def log_portfolio_value(self):
+        """
+        date = self.session.simulated_date
+        row = self.snapshots.filter(date=date.date()).values_list("cash", "positions").first()
+        if row is not None and row[0] is not None:
+            return PortfolioValuation.from_snapshot(row[0], date, row[1])
+        valuation = self.get_valuation()
+        self.save_snapshot(valuation)
+        return valuation
+
+    @query_budget(1)
+    def save_snapshot(self, valuation):
+        """Upsert the snapshot for the valuation's date in one statement."""
+        PortfolioSnapshot.objects.bulk_create(
+            [PortfolioSnapshot(
+                portfolio=self,
+                date=valuation.date.date(),
+                cash=valuation.cash,
+                total_value=valuation.total_value,
+                positions=valuation.snapshot_positions(),
+            )],
+            update_conflicts=True,
+            unique_fields=["portfolio", "date"],
+            update_fields=["cash", "total_value", "positions", "updated_at"],
+        )
+
+    @query_budget(4)
+    def log_portfolio_value(self, valuation=None):
+        valuation = valuation or self.get_valuation()
         PortfolioLog.objects.create(
             portfolio=self,
-            total_value=self.get_total_value(),
+            total_value=valuation.total_value,
             timestamp=self.session.simulated_date.strftime("%Y-%m-%d")
         )
+        self.save_snapshot(valuation)
+        transaction.on_commit(partial(session_cache.bump, self.session.pk))
+        return valuation
+
+    @classmethod
+    def log_values(cls, sessions):
+        """
+        End-of-day valuation of many sessions at once, each on its own simulated date. Lots of every
+        portfolio are summed per ticker in one query, priced against one tickers x dates matrix,
+        and the totals written with one bulk insert each of PortfolioLog and PortfolioSnapshot rows.
+        sessions need their portfolio loaded. Returns {session id: total value}; a session missing
+        a price is logged and left out.
+
+        """
+        sessions = [session for session in sessions if session.simulated_date]
+        if not sessions:
+            return {}
+        index = {session.portfolio_id: i for i, session in enumerate(sessions)}
+        rows = list(
+            Position.objects.filter(portfolio_id__in=index)
+            .values("portfolio_id", "ticker")
+            .annotate(total_shares=Sum("shares"), cost_basis=Sum(F("shares") * F("share_price_at_purchase")))
+            .filter(total_shares__gt=0)
+            .order_by("portfolio_id", "ticker")
+            .values_list("portfolio_id", "ticker", "total_shares", "cost_basis")
+        )
 
+        days = sorted({day_number(session.simulated_date) for session in sessions})
+        day_index = {day: i for i, day in enumerate(days)}
+        tickers = sorted({row[1] for row in rows})
+        ticker_index = {ticker: i for i, ticker in enumerate(tickers)}
+        prices = stock_data_wrapper.get_matrix(tickers, days) if rows else np.empty((0, len(days)))
+
+        owner = np.array([index[row[0]] for row in rows], dtype=np.intp)
+        shares = np.array([row[2] for row in rows], dtype=float)
+        session_day = np.array([day_index[day_number(session.simulated_date)] for session in sessions], dtype=np.intp)
+        ticker = np.array([ticker_index[row[1]] for row in rows], dtype=np.intp)
+        row_prices = prices[ticker, session_day[owner]]
+        market_value = np.bincount(owner, weights=shares * row_prices, minlength=len(sessions))
+        totals = np.array([session.portfolio.cash for session in sessions]) + market_value
+
+        positions = [[] for _ in sessions]
+        for (_, ticker, total_shares, cost_basis), i, price in zip(rows, owner, row_prices):
+            positions[i].append({"ticker": ticker, "shares": total_shares, "price": float(price),
+                                 "market_value": total_shares * float(price), "cost_basis": cost_basis})
+
+        logs, snapshots, values = [], [], {}
+        for session, total, held in zip(sessions, totals, positions):
+            if np.isnan(total):
+                missing = ", ".join(p["ticker"] for p in held if p["price"] != p["price"])
+                logging.error(f"Could not value session {session.id} on {session.simulated_date:%Y-%m-%d}, "
+                              f"no price for {missing}")
+                continue
+            values[session.id] = float(total)
+            logs.append(PortfolioLog(portfolio_id=session.portfolio_id, total_value=total,
+                                     timestamp=session.simulated_date.strftime("%Y-%m-%d")))
+            snapshots.append(PortfolioSnapshot(portfolio_id=session.portfolio_id, date=session.simulated_date.date(),
+                                               cash=session.portfolio.cash, total_value=total, positions=held))
+
+        with transaction.atomic():
+            PortfolioLog.objects.bulk_create(logs)
+            PortfolioSnapshot.objects.bulk_create(
+                snapshots,
+                update_conflicts=True,
+                unique_fields=["portfolio", "date"],
+                update_fields=["cash", "total_value", "positions", "updated_at"],
+            )
+            transaction.on_commit(partial(session_cache.bump_many, list(values)))
+        return values
+
+    def trades_changed(self, session):
+        """
+        Called inside a trade's transaction. Today's holdings no longer match the snapshot: clearing
+        its cash marks it stale, so the next holdings read rebuilds it while the value series keeps
+        the day's point. Once committed, the session's cached responses move to a new version.
+
+        """
+        self.snapshots.filter(date=session.simulated_date.date()).update(cash=None)
+        transaction.on_commit(partial(session_cache.bump, session.pk))
+
+    @query_budget(6)
     def buy_stock(self, ticker, shares, session_id, reasoning="None provided"):
         if shares <= 0:
             raise ValueError("Shares must be greater than 0")
@@ -55,86 +199,188 @@ class Portfolio(models.Model):
 
         if price is None:
             raise ValueError(f"Could not retrieve price for {ticker}")
-        if self.cash < shares * price:
-            raise ValueError(f"Insufficient funds, available: {self.cash}"
-                             f"share price: {price}, shares: {shares}"
-                             f"total cost: {shares * price}")
+        cost = shares * price
 
         session = SimulationSession.objects.get(id=session_id)
 
-        Position.objects.create(
-            portfolio=self,
-            session=session,
-            ticker=ticker,
-            shares=shares,
-            share_price_at_purchase=price,
-            purchase_timestamp=session.simulated_date.strftime("%Y-%m-%d"),
-        )
+        with transaction.atomic():
+            # The funds check and the debit are one conditional UPDATE, so concurrent trades can't overdraw.
+            if not Portfolio.objects.filter(pk=self.pk, cash__gte=cost).update(cash=F("cash") - cost):
+                self.refresh_from_db(fields=["cash"])
+                raise ValueError(f"Insufficient funds, available: {self.cash}"
+                                 f"share price: {price}, shares: {shares}"
+                                 f"total cost: {cost}")
 
-        TradeLog.objects.create(session=session, 
-                                action="buy", 
-                                symbol=ticker, 
-                                shares=shares, 
-                                total_price=shares * price,
-                                share_price=price,
-                                profit=0, 
-                                reasoning=reasoning,
-                                timestamp=session.simulated_date.strftime("%Y-%m-%d"))
-        
-        self.get_and_update_cash()
-        self.save()
+            Position.objects.create(
+                portfolio=self,
+                session=session,
+                ticker=ticker,
+                shares=shares,
+                share_price_at_purchase=price,
+                purchase_timestamp=session.simulated_date.strftime("%Y-%m-%d"),
+            )
 
-    def sell_stock(self, ticker, shares, session, reasoning="None provided", force=False):
+            TradeLog.objects.create(session=session, 
+                                    action="buy", 
+                                    symbol=ticker, 
+                                    shares=shares, 
+                                    total_price=cost,
+                                    share_price=price,
+                                    profit=0, 
+                                    reasoning=reasoning,
+                                    timestamp=session.simulated_date.strftime("%Y-%m-%d"))
+            self.trades_changed(session)
+        self.cash -= cost
 
+    @query_budget(8)
+    def sell_stock(self, ticker, shares, session, reasoning="None provided", force=False):
+        if shares <= 0:
+            raise ValueError("Shares must be greater than 0")
         ticker = ticker.upper()
         if ticker not in available_tickers and not force:
             raise ValueError("Invalid ticker")
         
-        total = sum(p.shares for p in self.holdings.filter(ticker=ticker))
-        if shares > total:
-            raise ValueError("Not enough shares")
         try:
             price = stock_data_wrapper.get(ticker, self.session.simulated_date)
-
-        except:
+        except Exception:
             if not force:
                 raise ValueError(f"Could not retrieve price for {ticker}")
-            price = self.holdings.filter(ticker=ticker).order_by("-purchase_timestamp").first().share_price_at_purchase
-        
+            price = None
 
-        remaining = shares
-        profit = 0
+        with transaction.atomic():
+            # Lock the portfolio row so concurrent sells can't consume the same lots.
+            Portfolio.objects.select_for_update().filter(pk=self.pk).values_list("pk", flat=True).get()
+            lots = list(
+                self.holdings.filter(ticker=ticker)
+                .order_by("purchase_timestamp", "id")
+                .values_list("id", "shares", "share_price_at_purchase")
+            )
+            if not lots or shares > sum(lot[1] for lot in lots):
+                raise ValueError("Not enough shares")
+            if price is None:
+                # Forced sell of a ticker with no price: close it out at the latest purchase price.
+                price = lots[-1][2]
 
-        for p in self.holdings.filter(ticker=ticker).order_by("purchase_timestamp"):
-            if p.shares <= remaining:
-                remaining -= p.shares
-                profit += (price - p.share_price_at_purchase) * p.shares
-                self.cash += p.shares * price
-                p.delete()
-            else:
-                p.shares -= remaining
-                profit += (price - p.share_price_at_purchase) * remaining
-                self.cash += remaining * price
-                remaining = 0
-                self.save()
-                p.save()
-                break
-
-        self.save()
-        
+            consumed, remainder, profit = consume_fifo(lots, shares, price)
+            if consumed:
+                Position.objects.filter(id__in=consumed).delete()
+            if remainder:
+                Position.objects.filter(id=remainder[0]).update(shares=remainder[1])
 
-        TradeLog.objects.create(session=session,
-                                 action="sell",
-                                 symbol=ticker, 
-                                 shares=shares, 
-                                 total_price=shares * price,
-                                 share_price=price,
-                                 profit=profit,
-                                 reasoning=reasoning,
-                                 timestamp=session.simulated_date.strftime("%Y-%m-%d"))
+            Portfolio.objects.filter(pk=self.pk).update(cash=F("cash") + shares * price)
+
+            TradeLog.objects.create(session=session,
+                                     action="sell",
+                                     symbol=ticker, 
+                                     shares=shares, 
+                                     total_price=shares * price,
+                                     share_price=price,
+                                     profit=profit,
+                                     reasoning=reasoning,
+                                     timestamp=session.simulated_date.strftime("%Y-%m-%d"))
+            self.trades_changed(session)
+        self.cash += shares * price
 
         return price * shares
 
+    def price_orders(self, tickers, date):
+        """Prices for tickers on date in one batched lookup, leaving out any that have no price."""
+        try:
+            return dict(zip(tickers, map(float, stock_data_wrapper.get_many(tickers, date))))
+        except ValueError:
+            # Some ticker has no price that day; price the rest one by one so only its orders fail.
+            prices = {}
+            for ticker in tickers:
+                try:
+                    prices[ticker] = stock_data_wrapper.get(ticker, date)
+                except Exception:
+                    pass
+            return prices
+
+    @query_budget(9)
+    def execute_orders(self, orders):
+        """
+        Execute a list of {"action": "buy" or "sell", "ticker", "shares", "reasoning"} orders in order,
+        against one in-memory book of cash and lots. Every ticker is priced in one batch, and all the
+        fills are written in one transaction with bulk queries, however many orders there are.
+        Returns one result per order; a rejected order leaves the others alone.
+
+        """
+        session = self.session
+        date = session.simulated_date
+        timestamp = date.strftime("%Y-%m-%d")
+        results = []
+        accepted = []
+        for order in orders:
+            result = {"action": None, "ticker": None, "shares": None, "status": "rejected", "price": None,
+                      "total": None, "profit": None, "error": None}
+            results.append(result)
+            if not isinstance(order, dict):
+                result["error"] = "Order must be an object with action, ticker and shares"
+                continue
+            action = str(order.get("action", "")).lower()
+            ticker = str(order.get("ticker", "")).upper()
+            try:
+                shares = float(order.get("shares", 0))
+            except (TypeError, ValueError):
+                shares = 0
+            result.update(action=action, ticker=ticker, shares=shares)
+            if action not in ("buy", "sell"):
+                result["error"] = "Action must be buy or sell"
+            elif shares <= 0:
+                result["error"] = "Shares must be greater than 0"
+            elif ticker not in available_tickers:
+                result["error"] = "Invalid ticker"
+            else:
+                accepted.append((result, order.get("reasoning") or "None provided"))
+        if not accepted:
+            return results
+
+        tickers = sorted({result["ticker"] for result, _ in accepted})
+        prices = self.price_orders(tickers, date)
+
+        with transaction.atomic():
+            cash = Portfolio.objects.select_for_update().filter(pk=self.pk).values_list("cash", flat=True).get()
+            lots = (self.holdings.filter(ticker__in=tickers)
+                    .order_by("purchase_timestamp", "id")
+                    .values_list("id", "ticker", "shares", "share_price_at_purchase"))
+            book = Book(cash, [Lot(*lot) for lot in lots])
+
+            trades = []
+            for result, reasoning in accepted:
+                action, ticker, shares = result["action"], result["ticker"], result["shares"]
+                price = prices.get(ticker)
+                if price is None:
+                    result["error"] = f"Could not retrieve price for {ticker}"
+                    continue
+                try:
+                    profit = book.fill(action, ticker, shares, price)
+                except ValueError as e:
+                    result["error"] = str(e)
+                    continue
+                result.update(status="filled", price=price, total=shares * price, profit=profit)
+                trades.append(TradeLog(session=session, action=action, symbol=ticker, shares=shares,
+                                       total_price=shares * price, share_price=price, profit=profit,
+                                       reasoning=reasoning, timestamp=timestamp))
+
+            if trades:
+                Position.objects.bulk_create(
+                    Position(portfolio=self, session=session, ticker=lot.ticker, shares=lot.shares,
+                             share_price_at_purchase=lot.price, purchase_timestamp=timestamp)
+                    for lot in book.opened
+                )
+                if book.closed:
+                    Position.objects.filter(id__in=book.closed).delete()
+                if book.changed:
+                    Position.objects.bulk_update(
+                        [Position(id=lot_id, shares=shares) for lot_id, shares in book.changed.items()], ["shares"]
+                    )
+                TradeLog.objects.bulk_create(trades)
+                Portfolio.objects.filter(pk=self.pk).update(cash=F("cash") + (book.cash - cash))
+                self.trades_changed(session)
+        self.cash = book.cash
+        return results
+
 
 class SimulationSession(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -147,6 +393,8 @@ class SimulationSession(models.Model):
     stocks = models.ManyToManyField(Stock, blank=True)
     name = models.CharField(max_length=100, unique=True, default = "Untitled Session")
     simulated_date = models.DateTimeField(null=True, blank=True)
+    # Blank sessions trade through the LLM agents; otherwise the named rule-based strategy decides.
+    strategy = models.CharField(max_length=32, blank=True, default="", choices=strategy_choices)
 
 
 class Position(models.Model):
@@ -157,12 +405,44 @@ class Position(models.Model):
     purchase_timestamp = models.DateTimeField()
     session = models.ForeignKey(SimulationSession, on_delete=models.CASCADE, related_name="trades", null=True)
 
+    class Meta:
+        # Selling reads a ticker's lots oldest first; valuation groups a portfolio's lots by ticker.
+        indexes = [
+            models.Index(fields=["portfolio", "ticker", "purchase_timestamp"], name="position_lots_idx"),
+        ]
+
 
 class PortfolioLog(models.Model):
     portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE, related_name="logs")
     timestamp = models.DateTimeField()
     total_value = models.FloatField()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["portfolio", "timestamp"], name="portfoliolog_series_idx"),
+        ]
+
+
+class PortfolioSnapshot(models.Model):
+    """
+    A portfolio's holdings and value as of one simulated day, so read endpoints don't
+    re-price raw lots. A null cash means only total_value is current: the row was backfilled
+    from PortfolioLog or a trade has since changed the holdings.
+
+    """
+    portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE, related_name="snapshots")
+    date = models.DateField()
+    cash = models.FloatField(null=True, blank=True)
+    total_value = models.FloatField()
+    # [{"ticker", "shares", "price", "market_value", "cost_basis"}, ...]
+    positions = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["portfolio", "date"], name="unique_portfolio_snapshot_date"),
+        ]
+
 
 class TradeLog(models.Model):
     session = models.ForeignKey(SimulationSession, on_delete=models.CASCADE, related_name="logs")
@@ -174,3 +454,8 @@ class TradeLog(models.Model):
     profit = models.FloatField(null=True, blank=True)
     timestamp = models.DateTimeField()
     reasoning = models.TextField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["session", "timestamp"], name="tradelog_session_time_idx"),
+        ]
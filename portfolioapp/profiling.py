@@ -0,0 +1,47 @@
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+TRANSACTION_STATEMENTS = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE SAVEPOINT")
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def counted_queries(captured):
+    """Captured queries minus transaction control, which some backends log and others don't."""
+    return [query["sql"] for query in captured if not query["sql"].upper().startswith(TRANSACTION_STATEMENTS)]
+
+
+def query_budget(limit):
+    """
+    Declare the most database queries a view or model method may run, whatever the size of the
+    session. The budget is stored on the function as `query_budget`; when settings.ENFORCE_QUERY_BUDGETS
+    is on, going over it raises QueryBudgetExceeded with the offending SQL. On views, put it under
+    login_required so only the view's own queries count. The profile_queries command checks every
+    declared budget against a large synthetic session.
+
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not getattr(settings, "ENFORCE_QUERY_BUDGETS", False):
+                return view(*args, **kwargs)
+            with CaptureQueriesContext(connection) as queries:
+                response = view(*args, **kwargs)
+            counted = counted_queries(queries.captured_queries)
+            if len(counted) > limit:
+                raise QueryBudgetExceeded(
+                    f"{view.__name__} ran {len(counted)} queries, its budget is {limit}:\n" + "\n".join(counted)
+                )
+            return response
+
+        wrapper.query_budget = limit
+        return wrapper
+
+    return decorator
@@ -0,0 +1,87 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+
+def version_key(session_id):
+    return f"session:{session_id}:version"
+
+
+def current_version(session_id):
+    # A missing counter (never bumped, or evicted) starts from the clock, so it can't land on a
+    # version whose responses are still cached.
+    key = version_key(session_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump(session_id):
+    """Invalidate every cached response of a session by moving it to a new version."""
+    try:
+        cache.incr(version_key(session_id))
+    except ValueError:
+        current_version(session_id)
+
+
+def bump_many(session_ids):
+    """bump for many sessions in one cache round trip: each moves to a fresh clock-based version."""
+    version = time.time_ns()
+    cache.set_many({version_key(session_id): version for session_id in session_ids}, timeout=None)
+
+
+def count(name, view_name):
+    key = f"session_cache:{name}:{view_name}"
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def stats(view_names):
+    """Hits and misses per view, counted in the cache itself so every worker process adds to them."""
+    keys = [f"session_cache:{name}:{view}" for view in view_names for name in ("hits", "misses")]
+    counts = cache.get_many(keys)
+    result = {}
+    for view in view_names:
+        hits = counts.get(f"session_cache:hits:{view}", 0)
+        misses = counts.get(f"session_cache:misses:{view}", 0)
+        total = hits + misses
+        result[view] = {"hits": hits, "misses": misses, "hit_rate": round(hits / total, 3) if total else 0.0}
+    return result
+
+
+def cached_per_session(view):
+    """
+    Serve a session view's response from the cache until the session's state changes. Entries are
+    keyed on the session's version, the user and the query string; buy_stock, sell_stock,
+    execute_orders and log_portfolio_value bump the version, so stale entries are never read again
+    and simply expire. Only complete 200 responses are cached.
+
+    """
+
+    @wraps(view)
+    def wrapper(request, pk, *args, **kwargs):
+        query = hashlib.md5(request.GET.urlencode().encode()).hexdigest()
+        key = f"session:{pk}:{current_version(pk)}:{view.__name__}:{request.user.pk}:{query}"
+        cached = cache.get(key)
+        if cached is not None:
+            count("hits", view.__name__)
+            content_type, content = cached
+            return HttpResponse(content, content_type=content_type)
+
+        count("misses", view.__name__)
+        response = view(request, pk, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming:
+            timeout = getattr(settings, "SESSION_CACHE_TIMEOUT", 60 * 60)
+            cache.set(key, (response["Content-Type"], response.content), timeout)
+        return response
+
+    return wrapper
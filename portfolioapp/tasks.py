@@ -1,10 +1,19 @@
 # portfolioapp/tasks.py
 
+import os
+import random
+from contextlib import contextmanager
 from datetime import timedelta
-from celery import shared_task
-from portfolioapp.models import Portfolio, SimulationSession
+from celery import group, shared_task
+from celery.exceptions import MaxRetriesExceededError
+from django.core.cache import cache
+from django.db import transaction
+from openai import APIConnectionError, RateLimitError
+from portfolioapp.models import Portfolio, SimulationSession, Position
 from portfolioapp.libs.LLM import start_trade_for_session
 from portfolioapp.libs.data_fetchers import stock_data_wrapper
+from portfolioapp.libs.tickers import available_tickers
+from portfolioapp.libs.trading_calendar import trading_calendar
 
 
 import logging
@@ -13,31 +22,118 @@ logging.basicConfig(
     filename="log2.txt", filemode="a", format="%(asctime)s [%(levelname)s] %(message)s", level=logging.ERROR)
 
 
-def next_market_day(date):
-    """Returns the next weekday (skipping Saturday and Sunday)."""
-    next_day = date + timedelta(days=1)
-    while next_day.weekday() >= 5: 
-        next_day += timedelta(days=1)
-    return next_day
+def prefetch_session_prices(sessions):
+    """Download every held and tradable ticker across all session dates in one request."""
+    dates = [session.simulated_date for session in sessions if session.simulated_date]
+    if not dates:
+        return
+    tickers = set(available_tickers) | set(Position.objects.values_list("ticker", flat=True).distinct())
+    tickers.add(trading_calendar.reference_ticker)
+    stock_data_wrapper.prefetch(sorted(tickers), min(dates), max(dates) + timedelta(days=trading_calendar.lookahead))
+
+
+# How many agent conversations may talk to the model endpoint at once, across all workers.
+max_concurrent_conversations = int(os.getenv("MAX_CONCURRENT_CONVERSATIONS", 4))
+# Slots and tick markers expire on their own, so a killed worker can't hold them forever.
+conversation_lease = 30 * 60
+tick_lease = 2 * 60 * 60
+# Seconds between checks for a free conversation slot, and retries after a model endpoint error.
+slot_wait = 20
+conversation_retries = 3
+
+
+def tick_key(session_id):
+    return f"session:{session_id}:tick"
+
+
+@contextmanager
+def conversation_slot(token):
+    """Hold one of max_concurrent_conversations slots in the shared cache, yielding None if all are taken."""
+    for i in range(max_concurrent_conversations):
+        key = f"conversation-slot:{i}"
+        if cache.add(key, token, timeout=conversation_lease):
+            try:
+                yield key
+            finally:
+                if cache.get(key) == token:
+                    cache.delete(key)
+            return
+    yield None
+
+
+def advance_sessions(sessions):
+    """
+    Move sessions to their next trading day and mark every portfolio to market there in one bulk
+    pass, all in one transaction. Returns the sessions that advanced.
+
+    """
+    advanced = []
+    for session in sessions:
+        next_day = trading_calendar.next_trading_day(session.simulated_date)
+        if next_day is None:
+            logging.info(f"No market day after {session.simulated_date} yet, session {session.id} stays put")
+            continue
+        session.simulated_date = next_day
+        advanced.append(session)
+    with transaction.atomic():
+        SimulationSession.objects.bulk_update(advanced, ["simulated_date"])
+        Portfolio.log_values(advanced)
+    return advanced
 
 
 @shared_task
 def log_all_portfolios():
-    for session in SimulationSession.objects.all():
-        next_day = False
-        start_date = session.simulated_date
-        while not next_day:
-            session.simulated_date = next_market_day(session.simulated_date)
-            session.save()
-            portfolio = session.portfolio
+    """
+    Advance and value every session in one bulk pass, then fan out one adjust conversation per
+    session, so a slow conversation only holds up its own session and a tick takes as long as
+    the slowest session rather than all of them in turn. Sessions whose previous conversation is
+    still running are left for the next tick.
+
+    """
+    sessions = list(SimulationSession.objects.exclude(simulated_date=None).select_related("portfolio"))
+    prefetch_session_prices(sessions)
+    sessions = [session for session in sessions if cache.add(tick_key(session.id), True, timeout=tick_lease)]
+    # Only adjust_session releases a marker it was handed; every other one is released here, so a
+    # failed tick doesn't lock its sessions out until the lease runs out.
+    handed = set()
+    try:
+        advanced = advance_sessions(sessions)
+        # A session with no market day to move to has nothing new to adjust on, so it waits for the next tick.
+        if advanced:
+            group(adjust_session.si(session.id) for session in advanced).apply_async()
+            handed = {session.id for session in advanced}
+    finally:
+        cache.delete_many([tick_key(session.id) for session in sessions if session.id not in handed])
+    logging.info(f"Advanced and adjusting {len(advanced)} of {len(sessions)} sessions")
+
+
+# Waiting for a slot retries too, so allow about one conversation lease of waiting on top of the endpoint retries.
+@shared_task(bind=True, max_retries=conversation_lease // slot_wait + conversation_retries)
+def adjust_session(self, session_id, attempt=0):
+    """
+    Run the session's adjust conversation once a conversation slot is free. Waiting for a slot
+    doesn't count as a failure; rate limits and connection errors from the model endpoint are
+    retried with backoff up to conversation_retries times.
+
+    """
+    with conversation_slot(self.request.id) as slot:
+        if slot is None:
             try:
-                portfolio.log_portfolio_value()
-                next_day = True
-            except:
-                next_day = False
-        print(f"Advanced from {start_date} to {session.simulated_date}")
-    for session in SimulationSession.objects.all():
-        start_trade_for_session(session.id, "Adjust")
+                raise self.retry(countdown=slot_wait + random.uniform(0, slot_wait))
+            except MaxRetriesExceededError:
+                logging.error(f"No conversation slot came free for session {session_id}, skipping this tick")
+                cache.delete(tick_key(session_id))
+                return
+        try:
+            start_trade_for_session(session_id, "Adjust")
+        except (APIConnectionError, RateLimitError) as e:
+            if attempt < conversation_retries:
+                # The task is queued with session_id as a positional argument, so the retry must be too.
+                raise self.retry(exc=e, countdown=60 * 2 ** attempt, args=(session_id,), kwargs={"attempt": attempt + 1})
+            logging.error(f"Giving up on adjusting session {session_id}: {e}")
+        except Exception as e:
+            logging.error(f"Adjusting session {session_id} failed: {e}")
+    cache.delete(tick_key(session_id))
 
 
 @shared_task
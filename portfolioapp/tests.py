@@ -1,3 +1,904 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import math
+import os
+import tempfile
+import threading
+from datetime import date, datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import numpy as np
+import pandas as pd
+import requests
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import F
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from openai import APIConnectionError
+
+from portfolioapp import session_cache, tasks, views
+from portfolioapp.libs.data_fetchers import DataFetcher, StockDataWrapper, fetch_concurrently, stock_data_wrapper
+from portfolioapp.libs.downsample import lttb
+from portfolioapp.libs.features import price_feature_pack
+from portfolioapp.libs.feed_cache import FeedCache
+from portfolioapp.libs.ledger import Book, consume_fifo
+from portfolioapp.libs.LLM import LLMSession
+from portfolioapp.libs.price_matrix import PriceMatrix, day_number
+from portfolioapp.libs.price_store import PriceStore
+from portfolioapp.libs.replay import SnapshotArchive, read_gzip_members
+from portfolioapp.libs.strategies import (BuyAndHold, MarketData, Momentum, PortfolioView, Strategy, simulate, strategies,
+                                          strategy_choices)
+from portfolioapp.libs.topic_resolver import TopicResolver, topic_aliases
+from portfolioapp.libs.trading_calendar import TradingCalendar
+from portfolioapp.management.commands import log_data
+from portfolioapp.models import Portfolio, PortfolioLog, PortfolioSnapshot, Position, SimulationSession, TradeLog
+
+TICKERS = ["AAPL", "MSFT", "NVDA"]
+HOLIDAY = date(2025, 1, 20)
+# Weekdays of January 2025 but Martin Luther King Jr. Day.
+TRADING_DAYS = [date(2025, 1, 1) + timedelta(days=n) for n in range(1, 31)]
+TRADING_DAYS = [d for d in TRADING_DAYS if d.weekday() < 5 and d != HOLIDAY]
+
+
+def seed_prices(wrapper, prices, start, end):
+    """
+    Put {ticker: {date: close}} in a StockDataWrapper and mark start to end as fetched for those
+    tickers, so lookups in that range are answered locally and never reach the store or yfinance.
+
+    """
+    wrapper.prices.update({t: {day_number(d): close for d, close in days.items()} for t, days in prices.items()})
+    for ticker in prices:
+        wrapper.fetched.setdefault(ticker, []).append((day_number(start), day_number(end) + 1))
+        wrapper._loaded.add(ticker)
+
+
+def january_prices(tickers):
+    """A price per trading day of January 2025 for each ticker, rising by a different step per ticker."""
+    return {t: {day: 100.0 + (i + 1) * n for n, day in enumerate(TRADING_DAYS)} for i, t in enumerate(tickers)}
+
+
+def reference_lttb(x, y, threshold):
+    """Largest-Triangle-Three-Buckets as first published, one point and one bucket at a time."""
+    n = len(x)
+    every = (n - 2) / (threshold - 2)
+    kept = [0]
+    a = 0
+    for i in range(threshold - 2):
+        avg_start = math.floor((i + 1) * every) + 1
+        avg_end = min(math.floor((i + 2) * every) + 1, n)
+        avg_x = sum(x[avg_start:avg_end]) / (avg_end - avg_start)
+        avg_y = sum(y[avg_start:avg_end]) / (avg_end - avg_start)
+        max_area, next_a = -1, None
+        for j in range(math.floor(i * every) + 1, math.floor((i + 1) * every) + 1):
+            area = abs((x[a] - avg_x) * (y[j] - y[a]) - (x[a] - x[j]) * (avg_y - y[a])) / 2
+            if area > max_area:
+                max_area, next_a = area, j
+        kept.append(next_a)
+        a = next_a
+    kept.append(n - 1)
+    return kept
+
+
+def close(day):
+    """The close fake_download reports for a day number, the same for every ticker."""
+    return 100.0 + day % 7
+
+
+def fake_download(tickers, start, end):
+    """What StockDataWrapper.download returns for start to end day numbers: a close for every weekday."""
+    return {t: {d: close(d) for d in range(start, end) if date.fromordinal(d).weekday() < 5} for t in tickers}
+
+
+class PriceTests(SimpleTestCase):
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.path = os.path.join(folder.name, "prices.sqlite3")
+        patcher = mock.patch.object(StockDataWrapper, "download", side_effect=fake_download)
+        self.download = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_prefetch_downloads_once_per_range(self):
+        prices = StockDataWrapper()
+        prices.prefetch(TICKERS, date(2025, 1, 2), date(2025, 1, 31))
+        self.download.assert_called_once_with(TICKERS, day_number(date(2025, 1, 2)), day_number(date(2025, 2, 1)))
+        prices.prefetch(TICKERS[:2], date(2025, 1, 6), date(2025, 1, 10))
+        self.assertEqual(prices.get("MSFT", date(2025, 1, 8)), close(day_number(date(2025, 1, 8))))
+        self.assertEqual(list(prices.get_many(TICKERS, date(2025, 1, 8))), [close(day_number(date(2025, 1, 8)))] * 3)
+        self.assertEqual(self.download.call_count, 1)
+        with self.assertRaises(ValueError):
+            prices.get("AAPL", date(2025, 1, 11))
+
+    def test_store_is_shared_between_wrappers(self):
+        StockDataWrapper(store=PriceStore(self.path)).prefetch(TICKERS, date(2025, 1, 2), date(2025, 1, 31))
+        other = StockDataWrapper(store=PriceStore(self.path))
+        self.assertEqual(other.get_matrix(TICKERS, [date(2025, 1, 6), date(2025, 1, 11)]).shape, (3, 2))
+        self.assertEqual(other.get("NVDA", date(2025, 1, 6)), close(day_number(date(2025, 1, 6))))
+        self.assertEqual(self.download.call_count, 1)
+
+    def test_failed_ticker_is_not_marked_fetched(self):
+        self.download.side_effect = lambda tickers, start, end: fake_download(["AAPL"], start, end)
+        prices = StockDataWrapper(store=PriceStore(self.path))
+        prices.prefetch(TICKERS, date(2025, 1, 2), date(2025, 1, 31))
+        self.assertEqual(PriceStore(self.path).load(TICKERS)[1], {"AAPL": [("2025-01-02", "2025-02-01")], "MSFT": [], "NVDA": []})
+        self.download.side_effect = fake_download
+        prices.prefetch(TICKERS, date(2025, 1, 2), date(2025, 1, 31))
+        self.assertEqual(self.download.call_args.args[0], ["MSFT", "NVDA"])
+
+    def test_store_starts_over_when_adjustment_changes(self):
+        adjusted = PriceStore(self.path, adjustment="adjusted")
+        adjusted.save({"AAPL": {"2025-01-02": 90.0}}, [("AAPL", "2025-01-02", "2025-01-03")])
+        self.assertEqual(PriceStore(self.path).load(["AAPL"]), ({"AAPL": {}}, {"AAPL": []}))
+
+    def test_todays_price_expires(self):
+        today = date.today()
+        prices = StockDataWrapper(store=PriceStore(self.path))
+        self.download.side_effect = lambda tickers, start, end: {t: {d: 100.0 for d in range(start, end)} for t in tickers}
+        with mock.patch("portfolioapp.libs.data_fetchers.time.monotonic", return_value=1000.0):
+            prices.prefetch(["AAPL"], today - timedelta(days=3), today)
+            self.assertEqual(prices.get("AAPL", today), 100.0)
+        self.assertEqual(PriceStore(self.path).load(["AAPL"])[1]["AAPL"], [((today - timedelta(days=3)).isoformat(), today.isoformat())])
+        with mock.patch("portfolioapp.libs.data_fetchers.time.monotonic", return_value=1000.0 + prices.live_ttl - 1):
+            prices.get("AAPL", today)
+        self.assertEqual(self.download.call_count, 1)
+        with mock.patch("portfolioapp.libs.data_fetchers.time.monotonic", return_value=1000.0 + prices.live_ttl):
+            prices.get("AAPL", today)
+        self.assertEqual(self.download.call_count, 2)
+
+
+class PriceMatrixTests(SimpleTestCase):
+    def test_day_number_accepts_every_date_type(self):
+        ordinal = date(2025, 1, 2).toordinal()
+        for value in ["2025-01-02", "2025-01-02 00:00:00", date(2025, 1, 2), datetime(2025, 1, 2, 15, tzinfo=timezone.utc),
+                      pd.Timestamp("2025-01-02"), np.datetime64("2025-01-02"), ordinal]:
+            with self.subTest(value=value):
+                self.assertEqual(day_number(value), ordinal)
+
+    def test_lookups(self):
+        prices = PriceMatrix()
+        prices.update({"AAPL": {1: 10.0, 3: 30.0}})
+        prices.update({"MSFT": {2: 20.0}})
+        self.assertEqual(prices.get("AAPL", 3), 30.0)
+        self.assertTrue(np.isnan(prices.get("AAPL", 2)))
+        self.assertTrue(np.isnan(prices.get("NVDA", 1)))
+        np.testing.assert_array_equal(prices.get_matrix(["MSFT", "NVDA", "AAPL"], [1, 2, 4]),
+                                      [[np.nan, 20.0, np.nan], [np.nan] * 3, [10.0, np.nan, np.nan]])
+
+    def test_update_never_writes_a_published_snapshot(self):
+        prices = PriceMatrix()
+        prices.update({"AAPL": {1: 10.0, 2: np.nan}})
+        snapshot = prices._state
+        prices.update({"AAPL": {1: 11.0, 2: 12.0}})
+        self.assertEqual(snapshot[2][0, 0], 10.0)
+        self.assertTrue(np.isnan(snapshot[2][0, 1]))
+        self.assertEqual(prices.get_many(["AAPL"], 2)[0], 12.0)
+
+
+class TradingCalendarTests(SimpleTestCase):
+    def setUp(self):
+        prices = StockDataWrapper()
+        # Fetched well past the last price, so days after it are known not to have traded yet.
+        seed_prices(prices, {"SPY": {day: 500.0 for day in TRADING_DAYS}}, date(2024, 12, 1), date(2025, 2, 28))
+        self.calendar = TradingCalendar(prices, reference_ticker="SPY")
+
+    def test_skips_weekends_and_holidays(self):
+        self.assertEqual(self.calendar.next_trading_day(date(2025, 1, 17)), date(2025, 1, 21))
+        self.assertEqual(self.calendar.prev_trading_day(date(2025, 1, 21)), date(2025, 1, 17))
+        self.assertFalse(self.calendar.is_trading_day(HOLIDAY))
+        self.assertTrue(self.calendar.is_trading_day(date(2025, 1, 21)))
+
+    def test_keeps_datetimes(self):
+        moment = datetime(2025, 1, 17, 15, 30, tzinfo=timezone.utc)
+        self.assertEqual(self.calendar.next_trading_day(moment), datetime(2025, 1, 21, 15, 30, tzinfo=timezone.utc))
+
+    def test_no_trading_day_yet(self):
+        self.assertIsNone(self.calendar.next_trading_day(date(2025, 1, 31)))
+
+    def test_trading_days_between_is_inclusive(self):
+        self.assertEqual(self.calendar.trading_days_between(date(2025, 1, 17), date(2025, 1, 22)),
+                         [date(2025, 1, 17), date(2025, 1, 21), date(2025, 1, 22)])
+
+
+class StubFeed(BaseHTTPRequestHandler):
+    """An RSS feed of two headlines naming the requested topic, with an ETag, that fails for AAPL."""
+
+    def do_GET(self):
+        self.server.requests += 1
+        topic = self.path.split("q=")[1]
+        if "AAPL" in topic:
+            self.send_error(500)
+            return
+        etag = f'"{topic}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        items = "".join(f"<item><title>{topic} {n}</title></item>" for n in ("one", "two"))
+        body = f"<rss version='2.0'><channel><title>{topic}</title>{items}</channel></rss>".encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/rss+xml")
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FetchConcurrentlyTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubFeed)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.addClassCleanup(cls.server.server_close)
+        cls.addClassCleanup(cls.server.shutdown)
+
+    def setUp(self):
+        self.server.requests = 0
+        self.fetcher = DataFetcher(type="url", url=f"http://127.0.0.1:{self.server.server_port}/rss?q={{topic}}")
+
+    def test_failures_come_back_apart_from_results(self):
+        jobs = {
+            "news": (self.fetcher, "STOCK MARKET NEWS", {}),
+            "AAPL": (self.fetcher, "AAPL", {}),
+            "MSFT": (self.fetcher, "MSFT", {"count": 1}),
+        }
+        with self.assertLogs(level="ERROR"):
+            results, errors = fetch_concurrently(jobs)
+        self.assertEqual(results, {"news": "STOCK+MARKET+NEWS one STOCK+MARKET+NEWS two", "MSFT": "MSFT one"})
+        self.assertEqual(list(errors), ["AAPL"])
+        self.assertIsInstance(errors["AAPL"], requests.HTTPError)
+
+    def test_conditional_fetch_skips_unchanged_feeds(self):
+        jobs = {topic: (self.fetcher, topic, {}) for topic in ("TECH NEWS", "MSFT")}
+        first, _ = fetch_concurrently(jobs, method="fetch_if_changed")
+        second, _ = fetch_concurrently(jobs, method="fetch_if_changed")
+        self.assertEqual(first["MSFT"], (True, "MSFT one MSFT two"))
+        self.assertEqual(second, {"TECH NEWS": (False, "TECH+NEWS one TECH+NEWS two"), "MSFT": (False, "MSFT one MSFT two")})
+        self.assertEqual(self.server.requests, 4)
+
+    def test_no_jobs(self):
+        self.assertEqual(fetch_concurrently({}), ({}, {}))
+
+
+class FeedCacheTests(SimpleTestCase):
+    def test_expires_after_ttl(self):
+        feeds = FeedCache(ttl=60)
+        with mock.patch("portfolioapp.libs.feed_cache.time.monotonic", return_value=1000.0):
+            feeds.set("today", ["headline"], permanent=False)
+            feeds.set("closed", ["old headline"], permanent=True)
+        with mock.patch("portfolioapp.libs.feed_cache.time.monotonic", return_value=1059.0):
+            self.assertEqual(feeds.get("today"), (True, ["headline"]))
+        with mock.patch("portfolioapp.libs.feed_cache.time.monotonic", return_value=1061.0):
+            self.assertEqual(feeds.get("today"), (False, None))
+            self.assertEqual(feeds.get("closed"), (True, ["old headline"]))
+
+    def test_evicts_least_recently_used(self):
+        feeds = FeedCache(maxsize=2)
+        feeds.set("a", 1, permanent=True)
+        feeds.set("b", 2, permanent=True)
+        feeds.get("a")
+        feeds.set("c", 3, permanent=True)
+        self.assertEqual(feeds.get("b"), (False, None))
+        self.assertEqual(feeds.get("a"), (True, 1))
+        self.assertEqual(feeds.get("c"), (True, 3))
+        self.assertEqual(feeds.stats()["hits"], 3)
+
+
+class TopicResolverTests(SimpleTestCase):
+    def setUp(self):
+        topics = ["STOCK MARKET NEWS", "POLITICS NEWS", "ECONOMICS NEWS", "TECH NEWS", "BUSINESS NEWS"] + TICKERS
+        self.resolver = TopicResolver(topics, TICKERS, aliases=topic_aliases)
+
+    def test_exact_topics_tickers_and_aliases(self):
+        self.assertEqual(self.resolver.resolve("stock market news"), "STOCK+MARKET+NEWS")
+        self.assertEqual(self.resolver.resolve("aapl"), "AAPL")
+        self.assertEqual(self.resolver.resolve("Apple"), "AAPL")
+        self.assertEqual(self.resolver.resolve("MARKET_DATA_MSFT"), "MARKET_DATA_MSFT")
+
+    def test_fuzzy_match(self):
+        self.assertEqual(self.resolver.resolve("economy news"), "ECONOMICS+NEWS")
+
+    def test_rejects_unknown(self):
+        with self.assertRaises(ValueError):
+            self.resolver.resolve("MARKET_DATA_ZZZZ")
+        with self.assertRaises(ValueError):
+            self.resolver.resolve("qqqqqqqq")
+
+
+class SnapshotArchiveTests(SimpleTestCase):
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.folder = folder.name
+
+    def snapshot(self, day, slot, data, indent=2):
+        """Write data where log_data saved a slot, in a folder per day or, if day is None, flat."""
+        folder = os.path.join(self.folder, day) if day else self.folder
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"{slot}.json")
+        with open(path, "w") as f:
+            json.dump(data, f, indent=indent)
+        return path
+
+    def test_latest_slot_at_or_before_time(self):
+        self.snapshot("2025-01-02", "09-00", {"TECH NEWS": {"google": "early", "twitter": "tweets"}})
+        self.snapshot("2025-01-02", "10-00", {"TECH NEWS": {"google": "late", "twitter": "more tweets"},
+                                               "POLITICS NEWS": {"error": "timed out"}})
+        self.snapshot("2025-01-02", "11-00", {"POLITICS NEWS": {"google": "vote"}}, indent=None)
+        archive = SnapshotArchive(self.folder)
+        self.assertEqual(archive.days(), ["2025-01-02"])
+        self.assertEqual(archive.lookup("TECH NEWS", "2025-01-02", "09-30")["google"], "early")
+        self.assertEqual(archive.lookup("TECH NEWS")["google"], "late")
+        self.assertIsNone(archive.lookup("POLITICS NEWS", date(2025, 1, 2), "10-30"))
+        self.assertEqual(archive.lookup("POLITICS NEWS", date(2025, 1, 2)), {"google": "vote"})
+        self.assertIsNone(archive.lookup("TECH NEWS", date(2025, 1, 3)))
+
+    def test_flat_snapshots_are_dated_by_mtime(self):
+        path = self.snapshot(None, "09-00", {"TECH NEWS": {"google": "flat"}})
+        os.utime(path, (datetime(2025, 1, 3, 9).timestamp(),) * 2)
+        self.assertEqual(SnapshotArchive(self.folder).lookup("TECH NEWS", date(2025, 1, 3)), {"google": "flat"})
+
+    def test_replays_news_and_prices(self):
+        self.snapshot("2025-01-02", "15-50", {"STOCK MARKET AAPL": {"google": "iPhone", "twitter": "$AAPL"},
+                                               "MARKET_DATA_AAPL": {"currentPrice": 243.851}})
+        self.snapshot("2025-01-03", "15-50", {"MARKET_DATA_AAPL": {"error": "rate limited"}})
+        google = DataFetcher(type="replay", folder=self.folder, source="google")
+        self.assertEqual(google.fetch("aapl", datetime(2025, 1, 2, 16)), "iPhone")
+        with self.assertRaises(ValueError):
+            google.fetch("TECH NEWS", datetime(2025, 1, 2))
+        prices = StockDataWrapper(replay=SnapshotArchive(self.folder))
+        self.assertEqual(prices.get("AAPL", date(2025, 1, 2)), 243.85)
+        with self.assertRaises(ValueError):
+            prices.get("AAPL", date(2025, 1, 3))
+
+
+class LogDataShardTests(SimpleTestCase):
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.folder = folder.name
+        self.command = log_data.Command(stdout=io.StringIO())
+        self.command.last_written = {}
+        self.today = date.today().toordinal()
+        self.shard = os.path.join(self.folder, f"{date.today().isoformat()}.jsonl.gz")
+
+    def capture(self, outcomes, prices):
+        with mock.patch.object(log_data, "fetch_concurrently", return_value=(outcomes, {})), \
+                mock.patch.object(StockDataWrapper, "download", return_value=prices):
+            self.command.capture(self.folder, {}, {})
+
+    def records(self):
+        return [json.loads(line) for line in read_gzip_members(self.shard).splitlines()]
+
+    def test_appends_only_what_changed(self):
+        self.capture({("TECH NEWS", "google"): (True, "chips"), ("TECH NEWS", "twitter"): (True, "tweets")},
+                     {"AAPL": {self.today: 243.85}})
+        self.capture({("TECH NEWS", "google"): (True, "more chips"), ("TECH NEWS", "twitter"): (False, "tweets")},
+                     {"AAPL": {self.today: 243.85}})
+        self.assertEqual([(r["key"], r["source"], r["value"]) for r in self.records()], [
+            ("TECH NEWS", "google", "chips"),
+            ("TECH NEWS", "twitter", "tweets"),
+            ("MARKET_DATA_AAPL", None, {"currentPrice": 243.85}),
+            ("TECH NEWS", "google", "more chips"),
+        ])
+        archive = SnapshotArchive(self.folder)
+        self.assertEqual(archive.lookup("TECH NEWS"), {"google": "more chips", "twitter": "tweets"})
+        self.assertEqual(archive.prices(["AAPL", "MSFT"], self.today, self.today + 1), {"AAPL": {self.today: 243.85}, "MSFT": {}})
+
+    def test_skips_a_member_still_being_written(self):
+        self.capture({("TECH NEWS", "google"): (True, "chips")}, {})
+        with open(self.shard, "ab") as f:
+            f.write(gzip.compress(b'{"time": "23-50"}\n')[:12])
+        self.assertEqual(len(self.records()), 1)
+
+    def test_replay_without_the_source(self):
+        self.capture({("STOCK MARKET AAPL", "google"): (True, "iPhone")}, {})
+        fetch = lambda source: DataFetcher(type="replay", folder=self.folder, source=source).fetch("AAPL", date.today())
+        self.assertEqual(fetch("google"), "iPhone")
+        with self.assertRaises(ValueError):
+            fetch("twitter")
+
+
+class PriceFeatureTests(SimpleTestCase):
+    def setUp(self):
+        prices = january_prices(TICKERS + ["SPY"])
+        # A day MSFT didn't trade is filled with the close before it.
+        prices["MSFT"][TRADING_DAYS[-2]] = np.nan
+        seed_prices(stock_data_wrapper, prices, date(2024, 12, 1), date(2025, 1, 31))
+
+    def test_features_over_the_window(self):
+        pack = price_feature_pack(TICKERS, date(2025, 1, 31), window=10)
+        self.assertEqual(list(pack.index), TICKERS)
+        # AAPL rises by 1 a trading day from 100, so its last 10 closes are 111 to 120.
+        aapl = pack.loc["AAPL"]
+        self.assertEqual((aapl["close"], aapl["prev_close"], aapl["high_52w"], aapl["low_52w"]), (120.0, 119.0, 120.0, 111.0))
+        self.assertEqual(aapl["sma_20"], 115.5)
+        self.assertEqual(aapl["ret_5d"], round(120 / 115 - 1, 4))
+        self.assertEqual(aapl["off_high"], 0)
+        self.assertTrue(np.isnan(aapl["ret_21d"]))
+        msft = pack.loc["MSFT"]
+        self.assertEqual((msft["close"], msft["prev_close"], msft["ret_1d"]), (140.0, 136.0, round(140 / 136 - 1, 4)))
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class SessionTestCase(TestCase):
+    """
+    A session on 2025-01-10 with January 2025 prices seeded, so trades never reach the network, and
+    a process-local cache in place of Redis.
+
+    """
+
+    def setUp(self):
+        seed_prices(stock_data_wrapper, january_prices(TICKERS + ["SPY"]), date(2024, 12, 1), date(2025, 1, 31))
+        cache.clear()
+        self.user = User.objects.create(username="trader")
+        self.session = self.create_session("trader", 100_000)
+
+    def create_session(self, name, cash):
+        portfolio = Portfolio.objects.create(cash=cash)
+        return SimulationSession.objects.create(user=self.user, portfolio=portfolio, amount=cash, name=name,
+                                                simulated_date=datetime(2025, 1, 10, tzinfo=timezone.utc))
+
+    def portfolio(self, session=None):
+        return Portfolio.objects.get(pk=(session or self.session).portfolio_id)
+
+    def call(self, view, session=None, **params):
+        """GET a session view as the session's user."""
+        request = RequestFactory().get("/", params)
+        request.user = self.user
+        return view(request, (session or self.session).pk)
+
+
+class ReconcileCashTests(SessionTestCase):
+    def test_running_balance_matches_replay(self):
+        portfolio = self.portfolio()
+        portfolio.buy_stock("AAPL", 10, self.session.id)
+        portfolio.buy_stock("MSFT", 5, self.session.id)
+        portfolio.sell_stock("AAPL", 4, self.session)
+        portfolio = self.portfolio()
+        self.assertEqual(portfolio.reconcile_cash(), (portfolio.cash, 0))
+        self.assertAlmostEqual(portfolio.cash, 100_000 - 6 * stock_data_wrapper.get("AAPL", date(2025, 1, 10))
+                               - 5 * stock_data_wrapper.get("MSFT", date(2025, 1, 10)))
+
+    def test_command_reports_and_fixes_drift(self):
+        self.portfolio().buy_stock("AAPL", 10, self.session.id)
+        Portfolio.objects.filter(pk=self.session.portfolio_id).update(cash=F("cash") + 50)
+        out = io.StringIO()
+        call_command("reconcile_cash", stdout=out)
+        self.assertIn("drifted, ledger", out.getvalue())
+        self.assertAlmostEqual(self.portfolio().reconcile_cash()[1], 50)
+        call_command("reconcile_cash", "--fix", stdout=out)
+        self.assertEqual(self.portfolio().reconcile_cash()[1], 0)
+
+
+class ConsumeFifoTests(SimpleTestCase):
+    lots = [(1, 10.0, 50.0), (2, 5.0, 60.0), (3, 8.0, 70.0)]
+
+    def test_consumes_oldest_first_and_splits_one_lot(self):
+        consumed, remainder, profit = consume_fifo(self.lots, 12, 80.0)
+        self.assertEqual(consumed, [1])
+        self.assertEqual(remainder, (2, 3.0))
+        self.assertAlmostEqual(profit, 10 * 30.0 + 2 * 20.0)
+
+    def test_exact_lots_leave_no_remainder(self):
+        consumed, remainder, profit = consume_fifo(self.lots, 15, 60.0)
+        self.assertEqual(consumed, [1, 2])
+        self.assertIsNone(remainder)
+        self.assertAlmostEqual(profit, 100.0)
+
+    def test_no_lots(self):
+        self.assertEqual(consume_fifo([], 5, 10.0), ([], None, 0))
+
+
+class BookTests(SimpleTestCase):
+    def test_fill_tracks_cash_lots_and_profit(self):
+        book = Book(1000)
+        self.assertEqual(book.fill("buy", "AAPL", 5, 100.0), 0)
+        self.assertEqual(book.fill("sell", "AAPL", 2, 110.0), 20.0)
+        self.assertAlmostEqual(book.cash, 1000 - 500 + 220)
+        self.assertEqual(book.positions(), {"AAPL": 3})
+
+    def test_rejects_bad_fills(self):
+        book = Book(100)
+        for action, shares, price in [("buy", 0, 10.0), ("sell", -1, 10.0), ("buy", 11, 10.0), ("sell", 1, 10.0)]:
+            with self.subTest(action=action, shares=shares), self.assertRaises(ValueError):
+                book.fill(action, "AAPL", shares, price)
+        self.assertEqual(book.cash, 100)
+
+
+class TradeToolTests(SessionTestCase):
+    def test_rejects_orders_one_at_a_time(self):
+        results = LLMSession(self.session.id).trade([
+            "buy 2 AAPL",
+            {"action": "buy", "ticker": "aapl", "shares": 2, "reasoning": "Momentum"},
+            {"action": "sell", "ticker": "MSFT", "shares": 1},
+            {"action": "hold", "ticker": "NVDA", "shares": 1},
+            {"action": "buy", "ticker": "NVDA", "shares": "a few"},
+        ])
+        self.assertEqual([(r["status"], r["ticker"]) for r in results], [
+            ("rejected", None), ("filled", "AAPL"), ("rejected", "MSFT"), ("rejected", "NVDA"), ("rejected", "NVDA"),
+        ])
+        self.assertTrue(all(r["error"] for r in results if r["status"] == "rejected"))
+        self.assertEqual(TradeLog.objects.get().reasoning, "Momentum")
+
+    def test_failures_come_back_as_errors(self):
+        session = LLMSession(self.session.id)
+        with self.assertLogs(level="ERROR"):
+            results = session.trade({"action": "buy", "ticker": "AAPL", "shares": 1})
+        self.assertEqual(results, [{"error": "Orders must be a list of orders."}])
+        with mock.patch.object(Portfolio, "execute_orders", side_effect=RuntimeError("database is locked")), \
+                self.assertLogs(level="ERROR"):
+            self.assertEqual(session.trade([]), [{"error": "Trade failed: database is locked"}])
+
+
+class SellStockTests(SessionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.price = stock_data_wrapper.get("AAPL", date(2025, 1, 10))
+        # Lots bought on different days, in the order they must be sold.
+        self.lots = [self.lot("AAPL", 10, 50.0, date(2025, 1, 2)), self.lot("AAPL", 5, 60.0, date(2025, 1, 3)),
+                     self.lot("AAPL", 8, 70.0, date(2025, 1, 6))]
+
+    def lot(self, ticker, shares, cost, day):
+        return Position.objects.create(portfolio=self.session.portfolio, session=self.session, ticker=ticker,
+                                       shares=shares, share_price_at_purchase=cost,
+                                       purchase_timestamp=datetime(day.year, day.month, day.day, tzinfo=timezone.utc))
+
+    def held(self, ticker="AAPL"):
+        return list(Position.objects.filter(ticker=ticker).order_by("purchase_timestamp").values_list("id", "shares"))
+
+    def test_sells_oldest_lots_first(self):
+        self.assertEqual(self.portfolio().sell_stock("AAPL", 12, self.session), 12 * self.price)
+        self.assertEqual(self.held(), [(self.lots[1].id, 3), (self.lots[2].id, 8)])
+        trade = TradeLog.objects.get(action="sell")
+        self.assertAlmostEqual(trade.profit, 10 * (self.price - 50) + 2 * (self.price - 60))
+        self.assertAlmostEqual(self.portfolio().cash, 100_000 + 12 * self.price)
+
+    def test_rejects_bad_sells(self):
+        for ticker, shares in [("AAPL", 0), ("AAPL", -3), ("AAPL", 23.5), ("MSFT", 1), ("ZZZZ", 1)]:
+            with self.subTest(ticker=ticker, shares=shares), self.assertRaises(ValueError):
+                self.portfolio().sell_stock(ticker, shares, self.session)
+        self.assertEqual(len(self.held()), 3)
+        self.assertFalse(TradeLog.objects.exists())
+        self.assertEqual(self.portfolio().cash, 100_000)
+
+    def test_forced_sell_without_a_price(self):
+        # A delisted ticker: fetched, but with no close to sell at.
+        seed_prices(stock_data_wrapper, {"ZZZZ": {}}, date(2024, 12, 1), date(2025, 1, 31))
+        self.lot("ZZZZ", 4, 30.0, date(2025, 1, 2))
+        self.lot("ZZZZ", 2, 40.0, date(2025, 1, 3))
+        with self.assertRaises(ValueError):
+            self.portfolio().sell_stock("ZZZZ", 6, self.session)
+        with self.assertRaises(ValueError):
+            self.portfolio().sell_stock("ZZZZ", -6, self.session, force=True)
+        # Closed out at the latest purchase price.
+        self.assertEqual(self.portfolio().sell_stock("ZZZZ", 6, self.session, force=True), 240.0)
+        self.assertEqual(self.held("ZZZZ"), [])
+        self.assertAlmostEqual(TradeLog.objects.get(symbol="ZZZZ").profit, 4 * 10.0)
+        with self.assertRaises(ValueError):
+            self.portfolio().sell_stock("ZZZZ", 1, self.session, force=True)
+
+
+class TradeHistoryTests(SessionTestCase):
+    def setUp(self):
+        super().setUp()
+        TradeLog.objects.bulk_create(
+            TradeLog(session=self.session, action="buy", symbol=TICKERS[n % 3], shares=1, total_price=100.0,
+                     share_price=100.0, profit=n, timestamp=datetime(2025, 1, 2 + n // 10, tzinfo=timezone.utc),
+                     reasoning="Synthetic")
+            for n in range(30)
+        )
+
+    def page(self, **params):
+        response = self.call(views.get_trades, **params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def test_pages_in_either_order(self):
+        for order, profits in [("asc", list(range(30))), ("desc", list(range(29, -1, -1)))]:
+            seen, page = [], {"next": ""}
+            while page["next"] is not None:
+                page = self.page(limit=7, order=order, cursor=page["next"], fields="profit")
+                seen += [trade["profit"] for trade in page["trades"]]
+            with self.subTest(order=order):
+                self.assertEqual(seen, profits)
+
+    def test_ndjson_streams_the_rest_with_the_requested_fields(self):
+        cursor = self.page(limit=10)["next"]
+        for _ in range(2):
+            response = self.call(views.get_trades, cursor=cursor, format="ndjson", fields="symbol,timestamp,profit")
+            self.assertTrue(response.streaming)
+            self.assertEqual(response["Content-Type"], "application/x-ndjson")
+            rows = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual(len(rows), 20)
+        self.assertEqual(list(rows[0]), ["symbol", "timestamp", "profit"])
+        self.assertEqual(rows[0], {"symbol": TICKERS[10 % 3], "timestamp": "2025-01-03", "profit": 10})
+
+    def test_rejects_bad_parameters(self):
+        for params in [{"fields": "price"}, {"fields": ","}, {"limit": 0}, {"limit": "ten"}, {"cursor": "nonsense"}]:
+            with self.subTest(**params):
+                self.assertEqual(self.call(views.get_trades, **params).status_code, 400)
+
+
+class SessionCacheTests(SessionTestCase):
+    def holdings(self):
+        return {row["ticker"]: row["shares"] for row in json.loads(self.call(views.get_holdings).content)}
+
+    def test_bumps_move_to_a_new_version(self):
+        version = session_cache.current_version(self.session.id)
+        self.assertEqual(session_cache.current_version(self.session.id), version)
+        session_cache.bump(self.session.id)
+        self.assertEqual(session_cache.current_version(self.session.id), version + 1)
+        # An evicted counter restarts from the clock, past every version handed out before it.
+        cache.delete(session_cache.version_key(self.session.id))
+        session_cache.bump(self.session.id)
+        self.assertGreater(session_cache.current_version(self.session.id), version + 1)
+        other = self.create_session("other", 1000)
+        session_cache.bump_many([self.session.id, other.id])
+        self.assertEqual(session_cache.current_version(self.session.id), session_cache.current_version(other.id))
+
+    def test_trades_invalidate_cached_responses(self):
+        self.assertEqual(self.holdings(), {"Cash": "N/A", "Total": "N/A"})
+        with self.assertNumQueries(0):
+            self.holdings()
+        # The version moves once the trade commits, so the next read is a miss.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.portfolio().buy_stock("AAPL", 3, self.session.id)
+        self.assertEqual(self.holdings()["AAPL"], 3)
+        stats = session_cache.stats(["get_holdings"])["get_holdings"]
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+
+    def test_only_complete_responses_are_cached(self):
+        for _ in range(2):
+            self.assertEqual(self.call(views.get_trades, limit=0).status_code, 400)
+            self.assertTrue(self.call(views.get_trades, format="ndjson").streaming)
+        self.assertEqual(session_cache.stats(["get_trades"])["get_trades"], {"hits": 0, "misses": 4, "hit_rate": 0.0})
+
+
+class AdjustSessionTests(SessionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tick = tasks.tick_key(self.session.id)
+        cache.add(self.tick, True)
+
+    def test_endpoint_errors_retry_with_the_same_arguments(self):
+        error = APIConnectionError(request=httpx.Request("POST", "https://openrouter.ai/api/v1"))
+        with mock.patch.object(tasks, "start_trade_for_session", side_effect=error) as trade, \
+                self.assertLogs(level="ERROR") as logs:
+            tasks.adjust_session.apply(args=(self.session.id,))
+        self.assertEqual(trade.call_args_list, [mock.call(self.session.id, "Adjust")] * (tasks.conversation_retries + 1))
+        self.assertIn(f"Giving up on adjusting session {self.session.id}", logs.output[-1])
+        self.assertIsNone(cache.get(self.tick))
+
+    def test_gives_up_when_no_slot_comes_free(self):
+        for i in range(tasks.max_concurrent_conversations):
+            cache.add(f"conversation-slot:{i}", "another task")
+        with mock.patch.object(tasks, "start_trade_for_session") as trade, self.assertLogs(level="ERROR") as logs:
+            tasks.adjust_session.apply(args=(self.session.id,))
+        trade.assert_not_called()
+        self.assertIn("No conversation slot came free", logs.output[-1])
+        self.assertIsNone(cache.get(self.tick))
+
+    def test_frees_its_slot(self):
+        with mock.patch.object(tasks, "start_trade_for_session") as trade:
+            tasks.adjust_session.apply(args=(self.session.id,))
+        trade.assert_called_once_with(self.session.id, "Adjust")
+        self.assertEqual(cache.get_many([f"conversation-slot:{i}" for i in range(tasks.max_concurrent_conversations)]), {})
+        self.assertIsNone(cache.get(self.tick))
+
+
+@mock.patch.object(tasks, "prefetch_session_prices")
+@mock.patch.object(tasks, "group")
+class LogAllPortfoliosTests(SessionTestCase):
+    def setUp(self):
+        super().setUp()
+        # Known to the end of February, so the last January session has no trading day to move to yet.
+        seed_prices(stock_data_wrapper, {"SPY": january_prices(["SPY"])["SPY"]}, date(2024, 12, 1), date(2025, 2, 28))
+        self.stuck = self.create_session("stuck", 1000)
+        SimulationSession.objects.filter(pk=self.stuck.pk).update(simulated_date=datetime(2025, 1, 31, tzinfo=timezone.utc))
+        # Still adjusting after the previous tick.
+        self.busy = self.create_session("busy", 1000)
+        cache.add(tasks.tick_key(self.busy.pk), "previous tick")
+
+    def held(self):
+        return {pk for pk in (self.session.pk, self.stuck.pk, self.busy.pk) if cache.get(tasks.tick_key(pk))}
+
+    def test_fans_out_the_sessions_that_advanced(self, group, prefetch):
+        tasks.log_all_portfolios()
+        self.assertEqual([signature.args for signature in group.call_args.args[0]], [(self.session.pk,)])
+        self.assertEqual(SimulationSession.objects.get(pk=self.session.pk).simulated_date.date(), date(2025, 1, 13))
+        self.assertEqual(SimulationSession.objects.get(pk=self.stuck.pk).simulated_date.date(), date(2025, 1, 31))
+        self.assertEqual(PortfolioLog.objects.get().portfolio_id, self.session.portfolio_id)
+        self.assertEqual(self.held(), {self.session.pk, self.busy.pk})
+
+    def test_a_failed_tick_releases_its_markers(self, group, prefetch):
+        group.return_value.apply_async.side_effect = ConnectionError("broker unreachable")
+        with self.assertRaises(ConnectionError):
+            tasks.log_all_portfolios()
+        self.assertEqual(self.held(), {self.busy.pk})
+
+
+class BacktestTests(SessionTestCase):
+    def trade(self, session_id, stage):
+        """Stands in for the agents: buys one AAPL share a day."""
+        Portfolio.objects.get(session__id=session_id).buy_stock("AAPL", 1, session_id)
+
+    def backtest(self, *args):
+        # Everything the run needs is seeded, so the up-front download is skipped.
+        with mock.patch.object(stock_data_wrapper, "prefetch"):
+            call_command("backtest", str(self.session.id), "--end", "2025-01-15", *args, stdout=io.StringIO())
+
+    def traded_days(self):
+        return list(TradeLog.objects.order_by("timestamp").values_list("timestamp__day", flat=True))
+
+    def test_resumes_without_trading_a_day_twice(self):
+        log_portfolio_value = Portfolio.log_portfolio_value
+
+        def killed_on_the_14th(portfolio, valuation=None):
+            if portfolio.session.simulated_date.date() == date(2025, 1, 14):
+                raise RuntimeError("killed")
+            return log_portfolio_value(portfolio, valuation)
+
+        with mock.patch("portfolioapp.management.commands.backtest.start_trade_for_session", side_effect=self.trade) as trade:
+            with mock.patch.object(Portfolio, "log_portfolio_value", autospec=True, side_effect=killed_on_the_14th), \
+                    self.assertRaises(RuntimeError):
+                self.backtest("--start", "2025-01-13")
+            self.assertEqual(self.traded_days(), [13, 14])
+            self.backtest()
+        self.assertEqual(trade.call_count, 3)
+        self.assertEqual(self.traded_days(), [13, 14, 15])
+        self.assertEqual(list(PortfolioSnapshot.objects.order_by("date").values_list("date__day", flat=True)), [13, 14, 15])
+        self.assertEqual(SimulationSession.objects.get(pk=self.session.pk).simulated_date.date(), date(2025, 1, 16))
+        self.assertIsNone(cache.get(tasks.tick_key(self.session.pk)))
+
+
+@override_settings(ENFORCE_QUERY_BUDGETS=True)
+class QueryBudgetTests(SessionTestCase):
+    """
+    The hot paths run a fixed number of queries however big the session is. Inside a TestCase every
+    transaction.atomic block is a savepoint, and assertNumQueries counts its SAVEPOINT and RELEASE
+    statements; query_budget leaves them out, and is enforced here too.
+
+    """
+
+    def buy_lots(self, session, lots):
+        """Buy every ticker `lots` times, one lot per order, so sizes grow without adding queries."""
+        results = self.portfolio(session).execute_orders(
+            [{"action": "buy", "ticker": t, "shares": 1} for t in TICKERS for _ in range(lots)]
+        )
+        self.assertTrue(all(r["status"] == "filled" for r in results))
+
+    def get(self, view, session=None, **params):
+        response = self.call(view, session, **params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def test_execute_orders(self):
+        self.buy_lots(self.session, 50)
+        orders = ([{"action": "sell", "ticker": t, "shares": 30.5} for t in TICKERS[:2]]
+                  + [{"action": "buy", "ticker": TICKERS[2], "shares": 10}])
+        portfolio = self.portfolio()
+        with self.assertNumQueries(11):
+            results = portfolio.execute_orders(orders)
+        self.assertEqual([r["status"] for r in results], ["filled"] * 3)
+        self.assertEqual(TradeLog.objects.filter(session=self.session).count(), 153)
+        portfolio = self.portfolio()
+        self.assertAlmostEqual(portfolio.cash, portfolio.replay_cash())
+
+    def test_get_holdings(self):
+        self.buy_lots(self.session, 50)
+        # The first poll after a trade rebuilds the day's snapshot; later polls are served from the cache.
+        with self.assertNumQueries(4):
+            holdings = self.get(views.get_holdings)
+        self.assertEqual([row["ticker"] for row in holdings], ["Cash"] + TICKERS + ["Total"])
+        with self.assertNumQueries(0):
+            self.get(views.get_holdings)
+        cache.clear()
+        with self.assertNumQueries(2):
+            self.assertEqual(self.get(views.get_holdings), holdings)
+
+    def test_get_trades(self):
+        TradeLog.objects.bulk_create(
+            TradeLog(session=self.session, action="buy", symbol=TICKERS[n % 3], shares=1, total_price=100.0,
+                     share_price=100.0, profit=0, timestamp=datetime(2025, 1, 2, tzinfo=timezone.utc) + timedelta(minutes=n))
+            for n in range(500)
+        )
+        with self.assertNumQueries(2):
+            page = self.get(views.get_trades, limit=200)
+        self.assertEqual(len(page["trades"]), 200)
+        seen = len(page["trades"])
+        while page["next"]:
+            with self.assertNumQueries(2):
+                page = self.get(views.get_trades, limit=200, cursor=page["next"])
+            seen += len(page["trades"])
+        self.assertEqual(seen, 500)
+
+    def test_log_values(self):
+        sessions = [self.session] + [self.create_session(f"budget-{n}", 10_000) for n in range(5)]
+        for session in sessions:
+            self.buy_lots(session, 3)
+        sessions = list(SimulationSession.objects.select_related("portfolio"))
+        with self.assertNumQueries(5):
+            totals = Portfolio.log_values(sessions)
+        self.assertEqual(PortfolioLog.objects.count(), len(sessions))
+        self.assertEqual(PortfolioSnapshot.objects.filter(cash__isnull=False).count(), len(sessions))
+        for session in sessions:
+            self.assertAlmostEqual(totals[session.id], self.portfolio(session).get_total_value())
+
+    def test_profile_queries_within_budget(self):
+        out = io.StringIO()
+        call_command("profile_queries", "--tickers", "10", "--lots", "4", "--trades", "50", "--days", "20", stdout=out)
+        self.assertIn("All code paths within their query budgets", out.getvalue())
+
+
+class StrategyTests(SimpleTestCase):
+    def market(self, closes):
+        return MarketData(TICKERS, np.array(closes, dtype=float))
+
+    def test_strategy_is_abstract(self):
+        with self.assertRaises(TypeError):
+            Strategy()
+
+    def test_rebalance_sells_first_and_never_overspends(self):
+        market = self.market([[100.0], [50.0], [10.0]])
+        portfolio = PortfolioView(cash=0.0, shares={"AAPL": 10})
+        orders = Strategy.rebalance(portfolio, market, np.array([0, 0.5, 0.5]), "test")
+        self.assertEqual([(o["action"], o["ticker"]) for o in orders], [("sell", "AAPL"), ("buy", "MSFT"), ("buy", "NVDA")])
+        self.assertEqual(orders[0]["shares"], 10)
+        self.assertLessEqual(sum(o["shares"] * p for o, p in zip(orders[1:], [50.0, 10.0])), 1000.0)
+
+    def test_buy_and_hold_trades_once(self):
+        market = self.market([[100.0], [50.0], [np.nan]])
+        orders = BuyAndHold().decide(date(2025, 1, 2), PortfolioView(cash=1000.0), market)
+        self.assertEqual({o["ticker"] for o in orders}, {"AAPL", "MSFT"})
+        self.assertEqual(BuyAndHold().decide(date(2025, 1, 3), PortfolioView(0.0, {"AAPL": 5}), market), [])
+
+    def test_momentum_holds_the_leaders(self):
+        market = self.market([[100.0, 90.0, 80.0], [100.0, 110.0, 120.0], [100.0, 100.0, 130.0]])
+        orders = Momentum(window=2, top=2).decide(date(2025, 1, 3), PortfolioView(cash=1000.0), market)
+        self.assertEqual({o["ticker"] for o in orders}, {"MSFT", "NVDA"})
+
+    def test_simulate_in_memory(self):
+        seed_prices(stock_data_wrapper, january_prices(TICKERS + ["SPY"]), date(2024, 12, 1), date(2025, 1, 31))
+        result = simulate(BuyAndHold(), TICKERS, date(2025, 1, 2), date(2025, 1, 31), 3000)
+        self.assertEqual(result.days, TRADING_DAYS)
+        self.assertEqual(result.trades, 3)
+        self.assertAlmostEqual(result.equity[0], 3000)
+        # A third of the cash went into each ticker at its first close.
+        expected = sum(1000 / prices[TRADING_DAYS[0]] * prices[TRADING_DAYS[-1]] for prices in january_prices(TICKERS).values())
+        self.assertAlmostEqual(result.equity[-1], expected, places=4)
+
+    def test_choices_follow_the_registry(self):
+        self.assertEqual(strategy_choices()[0], ("", "LLM agents"))
+        self.assertEqual([name for name, _ in strategy_choices()[1:]], list(strategies))
+
+
+class LTTBTests(SimpleTestCase):
+    def test_matches_reference(self):
+        rng = np.random.default_rng(0)
+        for n, threshold in [(10, 3), (100, 7), (1000, 100), (1234, 500), (5000, 999)]:
+            x = list(range(n))
+            y = list(np.cumsum(rng.normal(size=n)))
+            with self.subTest(n=n, threshold=threshold):
+                self.assertEqual(list(lttb(x, y, threshold)), reference_lttb(x, y, threshold))
+
+    def test_keeps_spike(self):
+        y = [0.0] * 1000
+        y[567] = 50.0
+        self.assertIn(567, lttb(range(1000), y, 20))
+
+    def test_short_series_untouched(self):
+        self.assertEqual(list(lttb(range(5), range(5), 5)), [0, 1, 2, 3, 4])
+        self.assertEqual(list(lttb(range(5), range(5), 50)), [0, 1, 2, 3, 4])
+
+    def test_tiny_threshold_keeps_endpoints(self):
+        for threshold in (0, 1, 2):
+            with self.subTest(threshold=threshold):
+                self.assertEqual(list(lttb(range(100), range(100), threshold)), [0, 99])
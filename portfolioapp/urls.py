@@ -6,6 +6,7 @@ urlpatterns = [
     path("buy/", views.buy),
     path("sell/", views.sell),
     path("api/chat-log/", views.chat_log_api, name="chat_log_api"),
+    path("api/cache-stats/", views.cache_stats, name="cache_stats"),
     path("", views.session_list, name="session_list"),
     path("session/create/", views.create_session, name="create_session"),
     path("session/<int:pk>/", views.view_session, name="view_session"),
@@ -1,4 +1,4 @@
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from .models import Portfolio, SimulationSession
 from .forms import SessionForm
@@ -9,21 +9,128 @@ import os
 from portfolioapp.libs.data_fetchers import stock_data_wrapper
 from portfolioapp.libs.LLM import start_trade_for_session
 from django.http import JsonResponse
-from .models import PortfolioLog
+from .models import PortfolioLog, PortfolioSnapshot
 from .models import Stock
-from django.views.decorators.http import require_GET
-from django.db.models import Sum
+from django.views.decorators.http import require_GET, condition
+from django.db.models import Count, Max, Q, Sum
 import yfinance as yf
 from .models import Portfolio, SimulationSession, Position
 from .models import TradeLog
 from portfolioapp.libs.LLM import start_trade_for_session
 from threading import Thread
+from .profiling import query_budget
+from . import session_cache
+from .session_cache import cached_per_session
 import time
+import hashlib
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import date, datetime, timezone
+from portfolioapp.libs.downsample import lttb
 
 LOG_FILE_PATH = "autonomous_trading_log.txt"
 
 
+DEFAULT_MAX_POINTS = 1000
+
+
+def snapshot_timestamp(day):
+    return int(datetime.combine(day, datetime.min.time(), tzinfo=timezone.utc).timestamp())
+
+
+def series_params(request):
+    """The from and to dates (YYYY-MM-DD, inclusive) and max_points of a value series request."""
+    start = request.GET.get("from")
+    end = request.GET.get("to")
+    max_points = int(request.GET.get("max_points", DEFAULT_MAX_POINTS))
+    if max_points < 0:
+        raise ValueError("max_points must not be negative")
+    return (date.fromisoformat(start) if start else None), (date.fromisoformat(end) if end else None), max_points
+
+
+def value_series(snapshots, start, end, max_points):
+    """
+    (date, total value) tuples of snapshots between start and end, cut down to max_points with
+    LTTB so the chart keeps its shape. max_points=0 returns every point.
+
+    """
+    if start:
+        snapshots = snapshots.filter(date__gte=start)
+    if end:
+        snapshots = snapshots.filter(date__lte=end)
+    rows = list(snapshots.order_by("date").values_list("date", "total_value"))
+    if max_points and len(rows) > max_points:
+        kept = lttb([day.toordinal() for day, _ in rows], [value for _, value in rows], max_points)
+        rows = [rows[i] for i in kept]
+    return rows
+
+
+TRADE_FIELDS = ("timestamp", "action", "symbol", "shares", "total_price", "share_price", "profit", "reasoning")
+DEFAULT_TRADE_FIELDS = ("timestamp", "action", "symbol", "shares", "total_price", "profit", "reasoning")
+DEFAULT_TRADE_PAGE = 100
+MAX_TRADE_PAGE = 1000
+
+
+def trade_fields(request):
+    if "fields" not in request.GET:
+        return DEFAULT_TRADE_FIELDS
+    fields = tuple(field.strip() for field in request.GET["fields"].split(",") if field.strip())
+    unknown = [field for field in fields if field not in TRADE_FIELDS]
+    if unknown or not fields:
+        raise ValueError(f"fields must be a comma separated list of {', '.join(TRADE_FIELDS)}")
+    return fields
+
+
+def trade_cursor(row):
+    """An opaque cursor pointing just past a trade row."""
+    return urlsafe_b64encode(json.dumps([row["timestamp"].isoformat(), row["id"]]).encode()).decode()
+
+
+def trades_after(trades, cursor, descending=False):
+    """trades keyset-ordered on (timestamp, id), starting after the row `cursor` points at."""
+    if descending:
+        trades = trades.order_by("-timestamp", "-id")
+    else:
+        trades = trades.order_by("timestamp", "id")
+    if not cursor:
+        return trades
+    try:
+        timestamp, trade_id = json.loads(urlsafe_b64decode(cursor.encode()))
+        timestamp = datetime.fromisoformat(timestamp)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if descending:
+        return trades.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=trade_id))
+    return trades.filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=trade_id))
+
+
+def trade_row(row, fields):
+    return {field: row[field].strftime("%Y-%m-%d") if field == "timestamp" else row[field] for field in fields}
+
+
+def series_state(request, pk):
+    """Snapshot count and last change for a session, looked up once per request for the conditional headers."""
+    if not hasattr(request, "_series_state"):
+        request._series_state = (
+            PortfolioSnapshot.objects.filter(portfolio__session__id=pk, portfolio__session__user=request.user)
+            .aggregate(count=Count("id"), updated=Max("updated_at"))
+        )
+    return request._series_state
+
+
+def series_etag(request, pk):
+    state = series_state(request, pk)
+    if state["updated"] is None:
+        return None
+    key = f"{request.path}:{request.user.pk}:{state['count']}:{state['updated'].timestamp()}:{request.GET.urlencode()}"
+    return hashlib.md5(key.encode()).hexdigest()
+
+
+def series_last_modified(request, pk):
+    return series_state(request, pk)["updated"]
+
+
 @login_required
+@query_budget(1)
 def session_list(request):
     sessions = SimulationSession.objects.filter(user=request.user).order_by("-created_at")
     return render(request, "session_list.html", {"sessions": sessions})
@@ -55,6 +162,7 @@ def create_session(request):
 
 
 @login_required
+@query_budget(1)
 def view_session(request, pk):
     session = get_object_or_404(SimulationSession, pk=pk, user=request.user)
     return render(request, "view_session.html", {"session": session})
@@ -71,6 +179,11 @@ def delete_session(request, pk):
     return redirect("session_list")
 
 
+@login_required
+def cache_stats(request):
+    return JsonResponse(session_cache.stats(["get_holdings", "get_trades", "portfolio_value_data", "value_over_time"]))
+
+
 def chat_log_api(request):
     if not os.path.exists(LOG_FILE_PATH):
         return JsonResponse({"messages": []})
@@ -112,9 +225,18 @@ def sell(request):
 
 
 @login_required
+@query_budget(2)
+@condition(etag_func=series_etag, last_modified_func=series_last_modified)
+@cached_per_session
 def portfolio_value_data(request, pk):
-    logs = PortfolioLog.objects.filter(portfolio__session__id=pk).order_by("timestamp")
-    data = [{"x": int(log.timestamp.timestamp()), "y": round(log.total_value)} for log in logs]
+    # Unchanged series are answered with a 304 off one aggregate query.
+    try:
+        start, end, max_points = series_params(request)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    snapshots = PortfolioSnapshot.objects.filter(portfolio__session__id=pk, portfolio__session__user=request.user)
+    data = [{"x": snapshot_timestamp(day), "y": round(value)}
+            for day, value in value_series(snapshots, start, end, max_points)]
     return JsonResponse(data, safe=False)
 
 
@@ -170,34 +292,30 @@ def search_stocks(request):
 
 
 @login_required
+@query_budget(4)
+@cached_per_session
 def get_holdings(request, pk):
-    session = get_object_or_404(SimulationSession, pk=pk, user=request.user)
-    cash = session.portfolio.get_and_update_cash()
-    tickers_held = set(session.portfolio.holdings.values_list("ticker", flat=True))
+    # The dashboard polls this, so it is two queries however many positions there are: the session
+    # with its portfolio, then the day's snapshot. After a trade the snapshot is gone and the first
+    # poll rebuilds it with one per-ticker aggregate and one upsert.
+    session = get_object_or_404(SimulationSession.objects.select_related("portfolio"), pk=pk, user=request.user)
+    valuation = session.portfolio.get_snapshot()
     data = [{"ticker": "Cash",
               "shares": "N/A", 
               "total_purchase_price": "N/A",
-              "value": round(cash, 2),
+              "value": round(valuation.cash, 2),
               "change": "N/A"}]
     
-    for ticker in tickers_held:
-        shares = 0
-        total_purchase_price = 0
-        for position in session.portfolio.holdings.filter(ticker=ticker):
-            shares += position.shares
-            total_purchase_price += position.shares * position.share_price_at_purchase
-        total_purchase_price = round(total_purchase_price, 2)
-        price = stock_data_wrapper.get(ticker, session.simulated_date)
-        if shares > 0:
-            data.append({
-                "ticker": ticker,
-                "shares": shares,
-                "total_purchase_price": total_purchase_price,
-                "value": round(shares * price, 2),
-                "change": round(price - position.share_price_at_purchase, 2),
-            })
+    for position in valuation.positions:
+        data.append({
+            "ticker": position.ticker,
+            "shares": position.shares,
+            "total_purchase_price": round(position.cost_basis, 2),
+            "value": round(position.market_value, 2),
+            "change": round(position.price - position.average_cost, 2),
+        })
         
-    value = round(sum([d["value"] for d in data]),2)
+    value = round(valuation.total_value, 2)
     data.append({
         "ticker": "Total",
         "shares": "N/A",
@@ -208,27 +326,48 @@ def get_holdings(request, pk):
     return JsonResponse(data, safe=False)
 
 @login_required
+@query_budget(2)
+@cached_per_session
 def get_trades(request, pk):
+    """
+    A session's trades in pages of `limit`, ordered by (timestamp, id), or newest first with
+    order=desc. `cursor` continues from the `next` of the previous page and `fields` picks the
+    columns, so the reasoning text can be left out. format=ndjson streams every trade after the
+    cursor instead, one JSON object per line, without holding them in memory.
+
+    """
     session = get_object_or_404(SimulationSession, pk=pk, user=request.user)
-    trades = TradeLog.objects.filter(session=session).order_by("timestamp")
-    data = []
-    for trade in trades: 
-        if trade.shares > 0:
-            data.append({
-                "timestamp": trade.timestamp.strftime("%Y-%m-%d"),
-                "action": trade.action,
-                "symbol": trade.symbol,
-                "shares": trade.shares,
-                "total_price": trade.total_price,
-                "reasoning": trade.reasoning,
-                "profit": trade.profit,
-            })
+    try:
+        fields = trade_fields(request)
+        limit = min(int(request.GET.get("limit", DEFAULT_TRADE_PAGE)), MAX_TRADE_PAGE)
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
+        descending = request.GET.get("order", "asc") == "desc"
+        trades = trades_after(TradeLog.objects.filter(session=session, shares__gt=0),
+                              request.GET.get("cursor"), descending)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    rows = trades.values(*dict.fromkeys(("id", "timestamp", *fields)))
+    if request.GET.get("format") == "ndjson":
+        lines = (json.dumps(trade_row(row, fields)) + "\n" for row in rows.iterator(chunk_size=2000))
+        return StreamingHttpResponse(lines, content_type="application/x-ndjson")
+
+    page = list(rows[:limit + 1])
+    next_cursor = trade_cursor(page[limit - 1]) if len(page) > limit else None
+    return JsonResponse({"trades": [trade_row(row, fields) for row in page[:limit]], "next": next_cursor})
 
-    return JsonResponse(data, safe=False)
 
 @login_required
+@query_budget(3)
+@condition(etag_func=series_etag, last_modified_func=series_last_modified)
+@cached_per_session
 def value_over_time(request, pk):
     session = get_object_or_404(SimulationSession, pk=pk, user=request.user)
-    logs = PortfolioLog.objects.filter(portfolio=session.portfolio).order_by("timestamp")
-    data = [(log.timestamp, round(log.total_value)) for log in logs]
-    return render(request, "value_over_time.html", {"data": data, "session": session})
\ No newline at end of file
+    try:
+        start, end, max_points = series_params(request)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    snapshots = PortfolioSnapshot.objects.filter(portfolio_id=session.portfolio_id)
+    data = [(day, round(value)) for day, value in value_series(snapshots, start, end, max_points)]
+    return render(request, "value_over_time.html", {"data": data, "session": session})